@@ -0,0 +1,40 @@
+"""Add composite indexes for listing a user's alerts
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00
+
+GET /alerts/ filters on user_id (and optionally severity) and orders by
+created_at, id. These indexes let both the filtered and unfiltered listings,
+including keyset pages, run as a single index range scan.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_alerts_user_severity_created_id",
+        "alerts",
+        ["user_id", "severity", "created_at", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_alerts_user_created_id",
+        "alerts",
+        ["user_id", "created_at", "id"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_alerts_user_created_id", table_name="alerts", if_exists=True)
+    op.drop_index("ix_alerts_user_severity_created_id", table_name="alerts", if_exists=True)
@@ -0,0 +1,54 @@
+"""Partition events and alerts by day and add hourly event rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 10:00:00
+
+Rebuilds events (on timestamp) and alerts (on created_at) as daily range
+partitioned tables so retention can drop whole partitions, and adds the
+event_rollups_hourly table that keeps per-device counts after raw events
+expire. PostgreSQL only; other databases keep plain tables.
+
+Partitioned primary keys must include the partition column, so the keys
+become (id, timestamp) and (id, created_at), and alerts.event_id no longer
+has a database-level foreign key to events.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.partitions import PARTITIONED_TABLES, convert_to_partitioned
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+
+    if not sa.inspect(bind).has_table("event_rollups_hourly"):
+        op.create_table(
+            "event_rollups_hourly",
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), primary_key=True),
+            sa.Column("device_id", sa.String(), primary_key=True),
+            sa.Column("event_type", sa.String(), primary_key=True),
+            sa.Column("bucket", sa.DateTime(), primary_key=True),
+            sa.Column("event_count", sa.Integer(), nullable=False),
+            sa.Column("max_confidence", sa.Float()),
+            sa.Column("sum_confidence", sa.Float()),
+        )
+
+    if bind.dialect.name != "postgresql":
+        return
+    for table in PARTITIONED_TABLES:
+        convert_to_partitioned(bind, table)
+
+
+def downgrade() -> None:
+    # Converting partitioned tables back is not supported; the rollups can go
+    op.drop_table("event_rollups_hourly")
@@ -0,0 +1,33 @@
+"""Add occurrence_count and max_confidence to events
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00
+
+Duplicate events coalesced into an earlier one are counted on that event
+instead of being stored as rows of their own.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("events")}
+    if "occurrence_count" not in columns:
+        op.add_column("events", sa.Column("occurrence_count", sa.Integer(), server_default="1"))
+    if "max_confidence" not in columns:
+        op.add_column("events", sa.Column("max_confidence", sa.Float()))
+
+
+def downgrade() -> None:
+    op.drop_column("events", "max_confidence")
+    op.drop_column("events", "occurrence_count")
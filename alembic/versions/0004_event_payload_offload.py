@@ -0,0 +1,42 @@
+"""Add location and blob store columns to events
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00
+
+Large raw_data payloads move to the blob store (app/blob_store.py); the row
+keeps their hash and size. location is copied out of raw_data so scoring
+no longer has to load the payload. Existing payloads stay inline.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    columns = {column["name"] for column in sa.inspect(bind).get_columns("events")}
+    if "location" not in columns:
+        op.add_column("events", sa.Column("location", sa.String()))
+        if bind.dialect.name == "postgresql":
+            op.execute("UPDATE events SET location = raw_data->>'location' WHERE raw_data IS NOT NULL")
+        elif bind.dialect.name == "sqlite":
+            op.execute("UPDATE events SET location = json_extract(raw_data, '$.location') WHERE raw_data IS NOT NULL")
+    if "raw_data_hash" not in columns:
+        op.add_column("events", sa.Column("raw_data_hash", sa.String(64)))
+    if "raw_data_size" not in columns:
+        op.add_column("events", sa.Column("raw_data_size", sa.Integer()))
+
+
+def downgrade() -> None:
+    op.drop_column("events", "raw_data_size")
+    op.drop_column("events", "raw_data_hash")
+    op.drop_column("events", "location")
@@ -0,0 +1,50 @@
+"""Add the devices table
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 15:00:00
+
+Devices are registered by their first event or heartbeat; the table holds
+last-seen times flushed from Redis (app/devices.py). Existing devices are
+registered from their events, with their newest event as last seen.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    if sa.inspect(bind).has_table("devices"):
+        return
+    op.create_table(
+        "devices",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("device_id", sa.String(), nullable=False),
+        sa.Column("first_seen_at", sa.DateTime()),
+        sa.Column("last_seen_at", sa.DateTime()),
+        sa.Column("offline_since", sa.DateTime()),
+        sa.UniqueConstraint("user_id", "device_id", name="uq_devices_user_device"),
+    )
+    op.create_index("ix_devices_id", "devices", ["id"])
+    op.create_index("ix_devices_user_last_seen", "devices", ["user_id", "last_seen_at"])
+    op.execute(
+        "INSERT INTO devices (user_id, device_id, first_seen_at, last_seen_at) "
+        "SELECT user_id, device_id, MIN(timestamp), MAX(timestamp) FROM events "
+        "WHERE user_id IS NOT NULL AND device_id IS NOT NULL GROUP BY user_id, device_id"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_devices_user_last_seen", table_name="devices")
+    op.drop_index("ix_devices_id", table_name="devices")
+    op.drop_table("devices")
@@ -0,0 +1,27 @@
+"""Index alerts by event_id
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 16:00:00
+
+Workers look up which events of a batch already have an alert before
+creating any, so a retried batch does not alert twice.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_alerts_event_id", "alerts", ["event_id"], if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_alerts_event_id", table_name="alerts", if_exists=True)
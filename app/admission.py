@@ -0,0 +1,205 @@
+"""
+Admission control for event ingestion: rate limits and load shedding.
+
+Every ingest request (POST /events/, POST /events/batch, and each batch of a
+/ws/events stream) is checked before any database work:
+
+- Token buckets per user and per (user, device_id), each refilled at its
+  rate and capped at its burst size. A request costs one token per event in
+  each bucket it touches. It is only admitted if every bucket has enough
+  tokens. A request larger than a bucket's burst is admitted once that bucket
+  is full, and leaves it in debt.
+- Load shedding when a processing lane the request's events are routed to
+  is longer than its limit (ADMISSION_MAX_QUEUE_DEPTH, or
+  ADMISSION_MAX_QUEUE_DEPTH_<LANE> for one lane), or this process is using
+  more than ADMISSION_MAX_DB_POOL_USAGE of its database connections. A
+  backlog on the bulk lane therefore never turns away critical events.
+
+Rejected HTTP requests get 429 with Retry-After. A streamed batch only sheds
+the events headed for a saturated lane. A noisy device only drains its own
+bucket, so the other devices of the same user keep being served.
+The buckets and the queue check run in a single Lua script, atomically in
+Redis and shared by all web processes. If Redis is unavailable, requests are
+admitted.
+"""
+import logging
+import math
+import os
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from .database import async_engine, pool_usage
+from .metrics import INGEST_REJECTED
+from .redis_client import async_redis_conn
+from .tasks import LANES
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_DEVICE_PER_SECOND = float(os.getenv("RATE_LIMIT_DEVICE_PER_SECOND", "20"))
+RATE_LIMIT_DEVICE_BURST = float(os.getenv("RATE_LIMIT_DEVICE_BURST", "100"))
+RATE_LIMIT_USER_PER_SECOND = float(os.getenv("RATE_LIMIT_USER_PER_SECOND", "2000"))
+RATE_LIMIT_USER_BURST = float(os.getenv("RATE_LIMIT_USER_BURST", "5000"))
+# Jobs waiting on a lane beyond which ingestion is shed; 0 disables
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "100000"))
+# Per-lane overrides, e.g. ADMISSION_MAX_QUEUE_DEPTH_BULK
+ADMISSION_MAX_QUEUE_DEPTHS = {
+    lane: int(os.getenv(f"ADMISSION_MAX_QUEUE_DEPTH_{lane.upper()}", ADMISSION_MAX_QUEUE_DEPTH))
+    for lane in LANES
+}
+# Fraction of the database pool in use beyond which ingestion is shed
+ADMISSION_MAX_DB_POOL_USAGE = float(os.getenv("ADMISSION_MAX_DB_POOL_USAGE", "1.0"))
+# Retry-After sent when shedding load
+ADMISSION_SHED_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_SHED_RETRY_AFTER_SECONDS", "5"))
+
+BUCKET_KEY_PREFIX = "ratelimit"
+
+# KEYS: ARGV[2] queues to watch, then token buckets (the user's first).
+# ARGV: now in ms, number of queues, the max depth of each queue, then rate
+# per second, burst and cost for each bucket. Returns nil if admitted,
+# otherwise {0, queue index} when a queue is too long or {bucket index, ms
+# until it has enough tokens}. Tokens are only taken when every bucket has
+# enough.
+ADMIT_SCRIPT = """
+local now = tonumber(ARGV[1])
+local queues = tonumber(ARGV[2])
+for i = 1, queues do
+    if redis.call('LLEN', KEYS[i]) >= tonumber(ARGV[2 + i]) then
+        return {0, i}
+    end
+end
+local tokens = {}
+local rejected, wait = 0, 0
+for i = queues + 1, #KEYS do
+    local base = queues + (i - queues) * 3
+    local rate, burst, cost = tonumber(ARGV[base]), tonumber(ARGV[base + 1]), tonumber(ARGV[base + 2])
+    local state = redis.call('HMGET', KEYS[i], 'tokens', 'updated')
+    local available = tonumber(state[1]) or burst
+    local updated = tonumber(state[2]) or now
+    available = math.min(burst, available + math.max(0, now - updated) * rate / 1000)
+    local needed = math.min(cost, burst)
+    if available < needed then
+        local ms = math.ceil((needed - available) * 1000 / rate)
+        if ms > wait then
+            rejected, wait = i - queues, ms
+        end
+    end
+    tokens[i] = available - cost
+end
+if rejected > 0 then
+    return {rejected, wait}
+end
+for i = queues + 1, #KEYS do
+    local base = queues + (i - queues) * 3
+    redis.call('HSET', KEYS[i], 'tokens', tostring(tokens[i]), 'updated', ARGV[1])
+    redis.call('PEXPIRE', KEYS[i], math.ceil(tonumber(ARGV[base + 1]) * 1000 / tonumber(ARGV[base])) + 1000)
+end
+return false
+"""
+
+@dataclass
+class Rejection:
+    reason: str  # "device", "user", "queue" or "db_pool"
+    retry_after: int  # seconds
+    lane: Optional[str] = None  # the saturated lane, for "queue"
+
+    @property
+    def detail(self) -> str:
+        if self.reason in ("device", "user"):
+            return f"Rate limit exceeded for this {self.reason}, retry after {self.retry_after}s"
+        return f"Server overloaded, retry after {self.retry_after}s"
+
+def user_bucket_key(user_id: int) -> str:
+    return f"{BUCKET_KEY_PREFIX}:user:{user_id}"
+
+def device_bucket_key(user_id: int, device_id: str) -> str:
+    return f"{BUCKET_KEY_PREFIX}:device:{user_id}:{device_id}"
+
+class AdmissionController:
+    def __init__(self, redis=async_redis_conn):
+        self.redis = redis
+        self._admit = redis.register_script(ADMIT_SCRIPT)
+
+    async def check(self, user_id: int, device_ids: List[str],
+                    event_lanes: Optional[List[str]] = None) -> Optional[Rejection]:
+        """
+        Admit a request carrying one event per entry of device_ids, or say why
+        not. event_lanes gives the lane each event is routed to; only those
+        lanes are checked for depth (every lane when None).
+        """
+        usage = pool_usage(async_engine.sync_engine)
+        if usage is not None and usage >= ADMISSION_MAX_DB_POOL_USAGE:
+            return Rejection("db_pool", ADMISSION_SHED_RETRY_AFTER_SECONDS)
+        # Lanes with a depth limit; 0 disables it
+        lanes = [
+            lane for lane, depth in ADMISSION_MAX_QUEUE_DEPTHS.items()
+            if depth > 0 and (event_lanes is None or lane in event_lanes)
+        ]
+        if not RATE_LIMIT_ENABLED and not lanes:
+            return None
+
+        keys = [LANES[lane].key for lane in lanes]
+        args = [int(time.time() * 1000), len(lanes)] + [ADMISSION_MAX_QUEUE_DEPTHS[lane] for lane in lanes]
+        if RATE_LIMIT_ENABLED:
+            keys.append(user_bucket_key(user_id))
+            args += [RATE_LIMIT_USER_PER_SECOND, RATE_LIMIT_USER_BURST, len(device_ids)]
+            for device_id, count in Counter(device_ids).items():
+                keys.append(device_bucket_key(user_id, device_id))
+                args += [RATE_LIMIT_DEVICE_PER_SECOND, RATE_LIMIT_DEVICE_BURST, count]
+        result = await self._admit(keys=keys, args=args)
+        if not result:
+            return None
+        bucket, wait_ms = int(result[0]), int(result[1])
+        if bucket == 0:
+            # wait_ms holds the index of the saturated queue
+            return Rejection("queue", ADMISSION_SHED_RETRY_AFTER_SECONDS, lanes[wait_ms - 1])
+        return Rejection("user" if bucket == 1 else "device", max(1, math.ceil(wait_ms / 1000)))
+
+admission = AdmissionController()
+
+async def _check(user_id: int, device_ids: List[str], lanes: Optional[List[str]]) -> Optional[Rejection]:
+    try:
+        return await admission.check(user_id, device_ids, lanes)
+    except Exception as e:
+        logger.error(f"Admission control unavailable, admitting request: {e}")
+        return None
+
+async def admit(user_id: int, device_ids: List[str], lanes: Optional[List[str]] = None) -> Optional[Rejection]:
+    """Check a request against the limits; fails open if Redis is unavailable"""
+    rejection = await _check(user_id, device_ids, lanes)
+    if rejection is not None:
+        INGEST_REJECTED.labels(rejection.reason).inc(len(device_ids))
+    return rejection
+
+async def admit_events(user_id: int, device_ids: List[str], lanes: List[str]) -> List[Optional[Rejection]]:
+    """
+    Check a streamed batch, returning a rejection or None per event. Events
+    headed for a saturated lane are shed and the rest are checked again, so
+    only rate limits and pool shedding reject the whole batch.
+    """
+    rejections: List[Optional[Rejection]] = [None] * len(device_ids)
+    pending = list(range(len(device_ids)))
+    while pending:
+        rejection = await _check(user_id, [device_ids[i] for i in pending], [lanes[i] for i in pending])
+        if rejection is None:
+            break
+        shed = [i for i in pending if rejection.lane is None or lanes[i] == rejection.lane]
+        for i in shed:
+            rejections[i] = rejection
+        INGEST_REJECTED.labels(rejection.reason).inc(len(shed))
+        pending = [i for i in pending if rejections[i] is None]
+    return rejections
+
+async def enforce_admission(user_id: int, device_ids: List[str], lanes: Optional[List[str]] = None):
+    """Raise 429 with Retry-After if the request is not admitted"""
+    rejection = await admit(user_id, device_ids, lanes)
+    if rejection is not None:
+        raise HTTPException(
+            status_code=429,
+            detail=rejection.detail,
+            headers={"Retry-After": str(rejection.retry_after)},
+        )
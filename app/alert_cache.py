@@ -0,0 +1,91 @@
+"""
+Per-user cache of the newest alerts, serving first pages of GET /alerts/.
+
+Each user has one Redis sorted set for all alerts, plus one per severity:
+
+    alerts:cache:{user_id}:all
+    alerts:cache:{user_id}:{severity}
+
+Members are "<zero-padded id>|<AlertResponse JSON>" scored by created_at in
+microseconds. With that ordering, ZREVRANGE returns the same order as the
+endpoint's ORDER BY created_at DESC, id DESC, ties included. Each set keeps
+the newest ALERT_CACHE_SIZE alerts and expires ALERT_CACHE_TTL_SECONDS after
+its last write.
+
+Workers write new alerts through to the sets in the pipeline that publishes
+them. A set created that way only holds alerts since it was created, so it
+can serve a page only if it has enough alerts. When a read misses, the
+endpoint fills the set from the database. If the user has fewer than
+ALERT_CACHE_SIZE alerts, the fill also adds a COMPLETE marker scored below
+every alert: the set then holds all of them, and short pages are hits too.
+The marker is the first member trimmed once the set outgrows the cache.
+"""
+import os
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import orjson
+
+from .schemas import AlertResponse
+
+# Newest alerts kept per user and severity; pages beyond this go to the database
+ALERT_CACHE_SIZE = int(os.getenv("ALERT_CACHE_SIZE", "200"))
+ALERT_CACHE_TTL_SECONDS = int(os.getenv("ALERT_CACHE_TTL_SECONDS", "3600"))
+
+COMPLETE = b"complete"
+ALERT_FIELDS = list(AlertResponse.model_fields)
+EPOCH = datetime(1970, 1, 1)
+
+def cache_key(user_id: int, severity: Optional[str] = None) -> str:
+    return f"alerts:cache:{user_id}:{severity or 'all'}"
+
+def cache_entry(alert: dict) -> tuple:
+    """(member, score) of an alert given as a dict with at least the AlertResponse fields"""
+    created_at = alert["created_at"]
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    body = {field: alert[field] for field in ALERT_FIELDS}
+    # Same text as the database path, which orjson-encodes the datetime
+    body["created_at"] = created_at.isoformat()
+    member = f"{alert['id']:012d}|".encode() + orjson.dumps(body)
+    # Whole microseconds stay exact in a sorted set's double score
+    return member, (created_at - EPOCH) // EPOCH.resolution
+
+def _trim(pipe, key: str):
+    pipe.zremrangebyrank(key, 0, -ALERT_CACHE_SIZE - 1)
+    pipe.expire(key, ALERT_CACHE_TTL_SECONDS)
+
+def cache_alerts(pipe, alerts: Iterable[dict]):
+    """Queue write-through of new alerts on a Redis pipeline; the caller executes it"""
+    keys = set()
+    for alert in alerts:
+        member, score = cache_entry(alert)
+        for key in (cache_key(alert["user_id"]), cache_key(alert["user_id"], alert["severity"])):
+            pipe.zadd(key, {member: score})
+            keys.add(key)
+    for key in keys:
+        _trim(pipe, key)
+
+async def fill_alert_cache(redis, user_id: int, severity: Optional[str], alerts: List[dict]):
+    """Store the newest ALERT_CACHE_SIZE alerts of a user, as read from the database"""
+    key = cache_key(user_id, severity)
+    pipe = redis.pipeline(transaction=False)
+    entries = dict(cache_entry(alert) for alert in alerts)
+    if len(alerts) < ALERT_CACHE_SIZE:
+        entries[COMPLETE] = -1
+    pipe.zadd(key, entries)
+    _trim(pipe, key)
+    await pipe.execute()
+
+def cacheable(skip: int, limit: int) -> bool:
+    return skip >= 0 and 0 < limit and skip + limit <= ALERT_CACHE_SIZE
+
+async def read_cached_alerts(redis, user_id: int, severity: Optional[str],
+                             skip: int, limit: int) -> Optional[List[bytes]]:
+    """AlertResponse JSON of a page of alerts, newest first, or None on a miss"""
+    # One extra member shows whether the set ends with the COMPLETE marker
+    members = await redis.zrevrange(cache_key(user_id, severity), skip, skip + limit)
+    page = [member.split(b"|", 1)[1] for member in members[:limit] if member != COMPLETE]
+    if len(page) == limit or (members and members[-1] == COMPLETE):
+        return page
+    return None
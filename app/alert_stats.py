@@ -0,0 +1,74 @@
+"""
+Per-user alert counters for GET /alerts/stats.
+
+process_events bumps Redis hashes in the same pipeline that publishes the
+alerts, so reading the statistics is a handful of hash reads instead of a
+COUNT(*) GROUP BY over the alerts table:
+
+    alert_stats:{user_id}:severity           severity  -> count
+    alert_stats:{user_id}:device             device_id -> count
+    alert_stats:{user_id}:hourly:{YYYYMMDD}  hour (HH) -> count, expires
+
+Severity and device counts cover every alert since the counters started
+(see scripts/backfill_alert_stats.py); hourly buckets are kept for
+ALERT_STATS_HOURLY_RETENTION_DAYS.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Tuple
+
+from redis.client import Pipeline
+
+ALERT_STATS_HOURLY_RETENTION_DAYS = int(os.getenv("ALERT_STATS_HOURLY_RETENTION_DAYS", "8"))
+MAX_STATS_HOURS = ALERT_STATS_HOURLY_RETENTION_DAYS * 24
+
+def severity_key(user_id: int) -> str:
+    return f"alert_stats:{user_id}:severity"
+
+def device_key(user_id: int) -> str:
+    return f"alert_stats:{user_id}:device"
+
+def hourly_key(user_id: int, day: datetime) -> str:
+    return f"alert_stats:{user_id}:hourly:{day:%Y%m%d}"
+
+def record_alert_stats(pipe: Pipeline, alerts: Iterable[Tuple[int, str, str, datetime]]):
+    """Queue counter updates for (user_id, severity, device_id, created_at) tuples on a pipeline"""
+    ttl = ALERT_STATS_HOURLY_RETENTION_DAYS * 86400
+    hourly_keys = set()
+    for user_id, severity, device_id, created_at in alerts:
+        pipe.hincrby(severity_key(user_id), severity, 1)
+        pipe.hincrby(device_key(user_id), device_id, 1)
+        key = hourly_key(user_id, created_at)
+        pipe.hincrby(key, f"{created_at:%H}", 1)
+        hourly_keys.add(key)
+    for key in hourly_keys:
+        pipe.expire(key, ttl)
+
+def hour_buckets(hours: int, now: datetime = None) -> List[datetime]:
+    """Start of each of the last `hours` hours, oldest first"""
+    now = (now or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    return [now - timedelta(hours=offset) for offset in range(hours - 1, -1, -1)]
+
+def _decode_hash(raw: dict) -> dict:
+    return {key.decode(): int(value) for key, value in raw.items()}
+
+async def read_alert_stats(redis, user_id: int, hours: int = 24) -> dict:
+    """Read a user's counters in one pipelined round-trip"""
+    buckets = hour_buckets(min(max(hours, 1), MAX_STATS_HOURS))
+    pipe = redis.pipeline(transaction=False)
+    pipe.hgetall(severity_key(user_id))
+    pipe.hgetall(device_key(user_id))
+    for bucket in buckets:
+        pipe.hget(hourly_key(user_id, bucket), f"{bucket:%H}")
+    results = await pipe.execute()
+
+    by_severity = _decode_hash(results[0])
+    return {
+        "total": sum(by_severity.values()),
+        "by_severity": by_severity,
+        "by_device": _decode_hash(results[1]),
+        "by_hour": [
+            {"bucket": bucket, "count": int(count or 0)}
+            for bucket, count in zip(buckets, results[2:])
+        ],
+    }
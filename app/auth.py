@@ -1,22 +1,123 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+import hashlib
+import hmac
+import os
+import secrets
+import time
 
 from .database import get_db
-from .models import User
-from .schemas import TokenData
+from .metrics import AUTH_CACHE_ENTRIES, AUTH_CACHE_READS
+from .models import DeviceApiKey, User
+from .schemas import CurrentUser, TokenData
 
 # Security configuration
 SECRET_KEY = "your-secret-key-here"  # In production, use environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+API_KEY_SECRET = os.getenv("API_KEY_SECRET", SECRET_KEY)  # HMAC key for device API key hashes
+API_KEY_PREFIX = "cam_"
+
+# Verified-token cache configuration
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+# Device API key index configuration; the TTL bounds how long a key revoked
+# in another process keeps working here
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "100000"))
+API_KEY_CACHE_TTL_SECONDS = float(os.getenv("API_KEY_CACHE_TTL_SECONDS", "60"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Ingest endpoints accept either a bearer token or a device API key
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+class TokenCache:
+    """
+    In-process LRU cache of verified credentials (bearer tokens, or device
+    API key hashes) and the user they resolve to.
+    Entries expire after the TTL or when the token itself expires, whichever
+    comes first, and can be dropped per user when that user changes.
+    Hits, misses and size are exported under the cache's name.
+    """
+
+    def __init__(self, name: str, max_size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[CurrentUser, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._hits = AUTH_CACHE_READS.labels(name, "hit")
+        self._misses = AUTH_CACHE_READS.labels(name, "miss")
+        AUTH_CACHE_ENTRIES.labels(name).set_function(lambda: len(self._entries))
+
+    def get(self, token: str) -> Optional[CurrentUser]:
+        entry = self._entries.get(token)
+        if entry is None:
+            self._misses.inc()
+            return None
+        user, expires_at = entry
+        if expires_at <= time.time():
+            self._remove(token)
+            self._misses.inc()
+            return None
+        self._entries.move_to_end(token)
+        self._hits.inc()
+        return user
+
+    def put(self, token: str, user: CurrentUser, token_expires_at: Optional[float] = None):
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        self._remove(token)
+        self._entries[token] = (user, expires_at)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached token of a user"""
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self._remove(token)
+
+    def invalidate(self, token: str):
+        self._remove(token)
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_user.get(entry[0].id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[entry[0].id]
+
+token_cache = TokenCache("token")
+# Active device API keys by HMAC, so ingestion never touches bcrypt or the database
+api_key_index = TokenCache("api_key", API_KEY_CACHE_SIZE, API_KEY_CACHE_TTL_SECONDS)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_cached_tokens(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
+    api_key_index.invalidate_user(target.id)
+
+@event.listens_for(DeviceApiKey, "after_update")
+@event.listens_for(DeviceApiKey, "after_delete")
+def _invalidate_cached_api_key(mapper, connection, target):
+    api_key_index.invalidate(target.key_hash)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -24,6 +125,13 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def generate_api_key() -> str:
+    return API_KEY_PREFIX + secrets.token_urlsafe(32)
+
+def hash_api_key(api_key: str) -> str:
+    """HMAC-SHA256 of a device API key; cheap to compute, useless without API_KEY_SECRET"""
+    return hmac.new(API_KEY_SECRET.encode(), api_key.encode(), hashlib.sha256).hexdigest()
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -34,30 +142,103 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def verify_token(token: str, db: AsyncSession) -> Optional[CurrentUser]:
+    """
+    Resolve a bearer token to its user, or None if it is not valid.
+    Verified tokens are cached so repeat requests skip both the JWT decode
+    and the user lookup.
+    """
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
         if email is None:
-            raise credentials_exception
+            return None
         token_data = TokenData(email=email)
     except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == token_data.email).first()
+        return None
+
+    db_user = await get_user_by_email(db, token_data.email)
+    if db_user is None:
+        return None
+    user = CurrentUser(id=db_user.id, email=db_user.email)
+    token_cache.put(token, user, payload.get("exp"))
+    return user
+
+async def verify_api_key(api_key: str, db: AsyncSession) -> Optional[CurrentUser]:
+    """
+    Resolve a device API key to its owner, or None if it is unknown or revoked.
+    Keys are looked up by their HMAC in the in-memory index; the database is
+    only consulted the first time a key is seen within the cache TTL.
+    """
+    key_hash = hash_api_key(api_key)
+    principal = api_key_index.get(key_hash)
+    if principal is not None:
+        return principal
+
+    result = await db.execute(
+        select(DeviceApiKey, User)
+        .join(User, DeviceApiKey.user_id == User.id)
+        .where(DeviceApiKey.key_hash == key_hash, DeviceApiKey.revoked_at.is_(None))
+    )
+    row = result.first()
+    if row is None:
+        return None
+    device_key, user = row
+    principal = CurrentUser(id=user.id, email=user.email, device_id=device_key.device_id)
+    api_key_index.put(key_hash, principal)
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = await verify_token(token, db)
     if user is None:
         raise credentials_exception
     return user
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+async def get_ingest_user(
+    token: Optional[str] = Depends(optional_oauth2_scheme),
+    api_key: Optional[str] = Depends(api_key_header),
+    db: AsyncSession = Depends(get_db)
+):
+    """Authenticate an ingest request by device API key (X-API-Key) or bearer token"""
+    user = None
+    if api_key:
+        user = await verify_api_key(api_key, db)
+    elif token:
+        user = await verify_token(token, db)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+def check_device_access(user: CurrentUser, device_id: str):
+    """A device API key may only submit events for its own device"""
+    if user.device_id is not None and user.device_id != device_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=f"API key is not valid for device {device_id}",
+        )
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not await run_in_threadpool(verify_password, password, user.hashed_password):
         return False
-    return user 
\ No newline at end of file
+    return user
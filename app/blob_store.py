@@ -0,0 +1,139 @@
+"""
+Content-addressed storage for large event payloads.
+
+Event.raw_data payloads bigger than RAW_DATA_INLINE_MAX_BYTES are written
+here under the SHA-256 of their canonical JSON encoding, and the events row
+keeps only that hash and the size. Identical payloads are stored once.
+
+BLOB_STORE_URL picks the backend:
+
+    file:///var/lib/camera-alerts/blobs   local directory (the default, data/blobs)
+    s3://bucket/prefix                    S3 or MinIO; set S3_ENDPOINT_URL for MinIO
+                                          (needs boto3)
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_BLOB_DIR = Path(__file__).resolve().parent.parent / "data" / "blobs"
+BLOB_STORE_URL = os.getenv("BLOB_STORE_URL", f"file://{DEFAULT_BLOB_DIR}")
+# Payloads up to this size stay in the events row; larger ones are offloaded
+RAW_DATA_INLINE_MAX_BYTES = int(os.getenv("RAW_DATA_INLINE_MAX_BYTES", "1024"))
+
+def encode_payload(payload: Any) -> bytes:
+    """Canonical JSON encoding, so equal payloads hash the same"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+def blob_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class BlobNotFound(KeyError):
+    pass
+
+class LocalBlobStore:
+    """Blobs as files under root/ab/cd/<digest>, written atomically"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        path = self._path(digest)
+        if path.exists():
+            # Refresh the mtime so prune keeps blobs that are still being written
+            os.utime(path)
+            return digest
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self._path(digest).read_bytes()
+        except FileNotFoundError:
+            raise BlobNotFound(digest)
+
+    def prune(self, max_age_seconds: float) -> int:
+        """Delete blobs not written for max_age_seconds; returns how many were deleted"""
+        cutoff = time.time() - max_age_seconds
+        deleted = 0
+        for path in self.root.glob("*/*/*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    deleted += 1
+            except FileNotFoundError:
+                pass
+        return deleted
+
+class S3BlobStore:
+    """Blobs as objects under bucket/prefix/<digest> in S3 or an S3-compatible store such as MinIO"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None):
+        import boto3  # only needed for this backend
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}/{digest}" if self.prefix else digest
+
+    def put(self, data: bytes) -> str:
+        digest = blob_digest(data)
+        self.client.put_object(Bucket=self.bucket, Key=self._key(digest), Body=data,
+                               ContentType="application/json")
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(digest))["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            raise BlobNotFound(digest)
+
+    def prune(self, max_age_seconds: float) -> int:
+        # Use a bucket lifecycle rule to expire old payloads
+        return 0
+
+def open_blob_store(url: str = BLOB_STORE_URL):
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        return LocalBlobStore(parsed.path)
+    if parsed.scheme == "s3":
+        return S3BlobStore(parsed.netloc, parsed.path, os.getenv("S3_ENDPOINT_URL"))
+    raise ValueError(f"Unsupported BLOB_STORE_URL: {url}")
+
+blob_store = open_blob_store()
+
+def offload_payload(payload: Any) -> Tuple[Optional[Any], Optional[str], int]:
+    """
+    Decide where a raw_data payload lives.
+    Returns (inline payload or None, blob digest or None, encoded size).
+    """
+    if payload is None:
+        return None, None, 0
+    data = encode_payload(payload)
+    if len(data) <= RAW_DATA_INLINE_MAX_BYTES:
+        return payload, None, len(data)
+    return None, blob_store.put(data), len(data)
+
+def offload_payloads(payloads: List[Any]) -> List[Tuple[Optional[Any], Optional[str], int]]:
+    return [offload_payload(payload) for payload in payloads]
+
+def load_payload(digest: str) -> Any:
+    return json.loads(blob_store.get(digest))
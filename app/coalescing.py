@@ -0,0 +1,258 @@
+"""
+Deduplication and burst coalescing for incoming events.
+
+Events from the same user with the same (device_id, event_type, location)
+that arrive within DEDUP_WINDOW_SECONDS of the previous one are merged into
+the first event of the burst instead of being stored and processed again.
+Only events the alert rules give the same severity and processing lane
+share a burst: a detection that escalates, say person_detected rising past
+a critical rule's min_confidence, opens a burst of its own and gets its own
+alert on the critical lane.
+The window slides with every duplicate, up to DEDUP_MAX_SPAN_SECONDS, after
+which the next event starts a new burst.
+
+Window state lives in Redis, so all web processes share it. Duplicates only
+bump counters in Redis; a background task folds them into the event rows
+(occurrence_count, max_confidence) every DEDUP_FLUSH_INTERVAL_SECONDS, so a
+motion storm costs one INSERT plus one UPDATE per second instead of one
+INSERT, job and alert per frame.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, case, func, update
+
+from .database import AsyncSessionLocal
+from .metrics import EVENTS_COALESCED
+from .models import Event
+from .redis_client import async_redis_conn
+from .schemas import EventCreate
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_WINDOW_SECONDS = float(os.getenv("DEDUP_WINDOW_SECONDS", "2"))
+DEDUP_MAX_SPAN_SECONDS = float(os.getenv("DEDUP_MAX_SPAN_SECONDS", "60"))
+DEDUP_FLUSH_INTERVAL_SECONDS = float(os.getenv("DEDUP_FLUSH_INTERVAL_SECONDS", "1"))
+
+WINDOW_KEY_PREFIX = "dedup:window"
+PENDING_COUNT_KEY = "dedup:pending:count"
+PENDING_CONFIDENCE_KEY = "dedup:pending:max_confidence"
+PENDING_TIMESTAMP_KEY = "dedup:pending:timestamp"
+
+# Returns the burst's [event_id, count, max_confidence, timestamp] if the event
+# is a duplicate, or nil if it opens a new burst (the caller then inserts it
+# and records its id with EventCoalescer.register). A burst whose first event
+# is still being written lets events through rather than lose them.
+CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local confidence = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'event_id', 'first_seen', 'last_seen')
+local event_id, first_seen, last_seen = state[1], state[2], state[3]
+if last_seen and now - tonumber(last_seen) <= tonumber(ARGV[2])
+        and now - tonumber(first_seen) <= tonumber(ARGV[3]) then
+    if not event_id or event_id == '' then
+        return false
+    end
+    local count = redis.call('HINCRBY', KEYS[1], 'count', 1)
+    local max_confidence = tonumber(redis.call('HGET', KEYS[1], 'max_confidence'))
+    if confidence > max_confidence then
+        max_confidence = confidence
+        redis.call('HSET', KEYS[1], 'max_confidence', ARGV[4])
+    end
+    redis.call('HSET', KEYS[1], 'last_seen', ARGV[1])
+    redis.call('PEXPIRE', KEYS[1], ARGV[5])
+    redis.call('HINCRBY', KEYS[2], event_id, 1)
+    local pending = tonumber(redis.call('HGET', KEYS[3], event_id) or '-1')
+    if max_confidence > pending then
+        redis.call('HSET', KEYS[3], event_id, tostring(max_confidence))
+    end
+    local timestamp = redis.call('HGET', KEYS[1], 'timestamp')
+    redis.call('HSET', KEYS[4], event_id, timestamp)
+    return {event_id, tostring(count), tostring(max_confidence), timestamp}
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'event_id', '', 'count', ARGV[6], 'max_confidence', ARGV[4],
+           'first_seen', ARGV[1], 'last_seen', ARGV[1])
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+return false
+"""
+
+# Atomically take (and clear) the duplicate counts waiting to be written
+TAKE_PENDING_SCRIPT = """
+local result = {
+    redis.call('HGETALL', KEYS[1]),
+    redis.call('HGETALL', KEYS[2]),
+    redis.call('HGETALL', KEYS[3]),
+}
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+return result
+"""
+
+# Put back counts taken by a flush that failed. ARGV holds event id, count,
+# max confidence and timestamp for each event; counts add to any that arrived
+# since, and the higher max confidence wins.
+RESTORE_PENDING_SCRIPT = """
+for i = 1, #ARGV, 4 do
+    local event_id = ARGV[i]
+    redis.call('HINCRBY', KEYS[1], event_id, ARGV[i + 1])
+    local pending = tonumber(redis.call('HGET', KEYS[2], event_id) or '-1')
+    if tonumber(ARGV[i + 2]) > pending then
+        redis.call('HSET', KEYS[2], event_id, ARGV[i + 2])
+    end
+    redis.call('HSETNX', KEYS[3], event_id, ARGV[i + 3])
+end
+"""
+
+@dataclass
+class Claim:
+    """Outcome of coalescing one incoming event"""
+    key: str
+    count: int  # occurrences merged into this event so far, including itself
+    max_confidence: float
+    event_id: Optional[int] = None  # set when merged into an earlier event
+    timestamp: Optional[datetime] = None
+
+    @property
+    def is_duplicate(self) -> bool:
+        return self.event_id is not None
+
+def window_key(user_id: int, event: EventCreate, event_class: str = "") -> str:
+    location = (event.raw_data or {}).get("location", "")
+    return f"{WINDOW_KEY_PREFIX}:{user_id}:{event.device_id}:{event.event_type}:{location}:{event_class}"
+
+class EventCoalescer:
+    def __init__(self, redis=async_redis_conn, window: float = DEDUP_WINDOW_SECONDS,
+                 max_span: float = DEDUP_MAX_SPAN_SECONDS):
+        self.redis = redis
+        self.window_ms = int(window * 1000)
+        self.max_span_ms = int(max_span * 1000)
+        self.ttl_ms = self.window_ms * 2 + 1000
+        self._claim = redis.register_script(CLAIM_SCRIPT)
+        self._take_pending = redis.register_script(TAKE_PENDING_SCRIPT)
+        self._restore_pending = redis.register_script(RESTORE_PENDING_SCRIPT)
+
+    async def claim(self, user_id: int, events: List[EventCreate],
+                    classes: Optional[List[str]] = None) -> List[Claim]:
+        """
+        Coalesce a list of events, returning one Claim per event. Events of the
+        list that share a burst share the same Claim object. A Claim that is
+        not a duplicate opens a new burst: the caller inserts its first event
+        and passes the new id to register. classes gives each event's severity
+        and lane; only events of the same class are merged.
+        """
+        claims: List[Claim] = []
+        leaders: Dict[str, Claim] = {}
+        for index, event in enumerate(events):
+            key = window_key(user_id, event, classes[index] if classes is not None else "")
+            leader = leaders.get(key)
+            if leader is not None:
+                leader.count += 1
+                leader.max_confidence = max(leader.max_confidence, event.confidence)
+            else:
+                leader = Claim(key=key, count=1, max_confidence=event.confidence)
+                leaders[key] = leader
+            claims.append(leader)
+
+        now_ms = int(time.time() * 1000)
+        pipe = self.redis.pipeline(transaction=False)
+        ordered = list(leaders.values())
+        for claim in ordered:
+            await self._claim(
+                keys=[claim.key, PENDING_COUNT_KEY, PENDING_CONFIDENCE_KEY, PENDING_TIMESTAMP_KEY],
+                args=[now_ms, self.window_ms, self.max_span_ms, claim.max_confidence, self.ttl_ms, claim.count],
+                client=pipe,
+            )
+        results = await pipe.execute()
+
+        for claim, result in zip(ordered, results):
+            if result:
+                event_id, count, max_confidence, timestamp = result
+                claim.event_id = int(event_id)
+                # Fold duplicates from this same list into the earlier event too
+                if claim.count > 1:
+                    await self.redis.hincrby(PENDING_COUNT_KEY, event_id, claim.count - 1)
+                    await self.redis.hincrby(claim.key, "count", claim.count - 1)
+                claim.count = int(count) + claim.count - 1
+                claim.max_confidence = float(max_confidence)
+                claim.timestamp = datetime.fromisoformat(timestamp.decode())
+        EVENTS_COALESCED.inc(len(events) - sum(1 for claim in ordered if not claim.is_duplicate))
+        return claims
+
+    async def register(self, claims: List[Tuple[Claim, int, datetime]]):
+        """Record the ids of newly inserted burst leaders so later duplicates can find them"""
+        if not claims:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for claim, event_id, timestamp in claims:
+            pipe.hset(claim.key, mapping={"event_id": event_id, "timestamp": timestamp.isoformat()})
+            # The window may have expired since the claim; don't leave the key behind without a TTL
+            pipe.pexpire(claim.key, self.ttl_ms)
+        await pipe.execute()
+
+    async def flush(self) -> int:
+        """Write pending duplicate counts to the events table; returns rows updated"""
+        counts, confidences, timestamps = await self._take_pending(
+            keys=[PENDING_COUNT_KEY, PENDING_CONFIDENCE_KEY, PENDING_TIMESTAMP_KEY]
+        )
+        counts = dict(zip(counts[::2], counts[1::2]))
+        if not counts:
+            return 0
+        confidences = dict(zip(confidences[::2], confidences[1::2]))
+        timestamps = dict(zip(timestamps[::2], timestamps[1::2]))
+
+        params = [
+            {
+                "event_id": int(event_id),
+                "event_timestamp": datetime.fromisoformat(timestamps[event_id].decode()),
+                "extra": int(count),
+                "new_max_confidence": float(confidences.get(event_id, 0)),
+            }
+            for event_id, count in counts.items()
+        ]
+        events = Event.__table__
+        current_max = func.coalesce(events.c.max_confidence, events.c.confidence)
+        stmt = (
+            update(events)
+            .where(events.c.id == bindparam("event_id"), events.c.timestamp == bindparam("event_timestamp"))
+            .values(
+                occurrence_count=events.c.occurrence_count + bindparam("extra"),
+                max_confidence=case(
+                    (current_max < bindparam("new_max_confidence"), bindparam("new_max_confidence")),
+                    else_=current_max,
+                ),
+            )
+        )
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(stmt, params)
+                await db.commit()
+        except Exception:
+            # Keep the counts for the next flush
+            await self._restore_pending(
+                keys=[PENDING_COUNT_KEY, PENDING_CONFIDENCE_KEY, PENDING_TIMESTAMP_KEY],
+                args=[value for event_id, count in counts.items()
+                      for value in (event_id, count, confidences.get(event_id, 0), timestamps[event_id])],
+            )
+            raise
+        return len(params)
+
+coalescer = EventCoalescer()
+
+async def flush_coalesced_events(interval: float = DEDUP_FLUSH_INTERVAL_SECONDS):
+    """Background task folding duplicate counts into the events table"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            updated = await coalescer.flush()
+            if updated:
+                logger.info(f"Folded duplicates into {updated} coalesced events")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Failed to flush coalesced events: {e}")
@@ -1,18 +1,126 @@
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 import os
+import time
+from typing import Optional
+
+from .metrics import DB_POOL_CAPACITY, DB_POOL_CHECKED_OUT, DB_POOL_TIMEOUTS, DB_POOL_WAIT_SECONDS
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432/camera_alerts")
+# Optional read replica for the heavy read endpoints; they use the primary when unset
+SQLALCHEMY_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Connections each pool keeps open, and how many more it may open under load.
+# Every web process and worker has its own pools, so keep
+# (web processes + workers) * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below Postgres max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# -1 allows unlimited overflow, which also disables db_pool_capacity and pool-based load shedding
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Seconds a request waits for a free connection before it is turned away with a 503
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+# Replace connections older than this, before Postgres or a proxy drops them
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test each connection on checkout so a restarted database costs one retry, not a failed request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync database URL onto the matching async driver"""
+    if url.startswith("postgresql://"):
+        return "postgresql+asyncpg://" + url[len("postgresql://"):]
+    if url.startswith("sqlite://"):
+        return "sqlite+aiosqlite://" + url[len("sqlite://"):]
+    return url
+
+def timed_pool_class(base: type, name: str) -> type:
+    """A pool class that records checkout waits and timeouts under the given pool label"""
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return base._do_get(self)
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(name).inc()
+            raise
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(name).observe(time.perf_counter() - start)
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+def pool_options(url: str, base: type, name: str) -> dict:
+    """Engine keyword arguments for a sized, monitored connection pool"""
+    if url.startswith("sqlite"):
+        # SQLite is only used locally; keep SQLAlchemy's default pools for it
+        return {}
+    return {
+        "poolclass": timed_pool_class(base, name),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def pool_capacity(engine) -> Optional[int]:
+    """Most connections an engine's pool may open, or None for pools without a limit"""
+    # Every pooled engine is created with DB_MAX_OVERFLOW; -1 lets it overflow without limit
+    if not isinstance(engine.pool, QueuePool) or DB_MAX_OVERFLOW < 0:
+        return None
+    return engine.pool.size() + DB_MAX_OVERFLOW
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+def monitor_pool(engine, name: str):
+    """Report how many connections of an engine's pool are in use, and how many it may open"""
+    if not isinstance(engine.pool, QueuePool):
+        return
+    # Read engine.pool on every scrape, as dispose() replaces the pool
+    DB_POOL_CHECKED_OUT.labels(name).set_function(lambda: engine.pool.checkedout())
+    if pool_capacity(engine) is not None:
+        DB_POOL_CAPACITY.labels(name).set_function(lambda: pool_capacity(engine))
+
+def pool_usage(engine) -> Optional[float]:
+    """Fraction of an engine's connections in use, or None for pools without a limit"""
+    capacity = pool_capacity(engine)
+    if capacity is None:
+        return None
+    return engine.pool.checkedout() / capacity
+
+# Sync engine, used by the RQ worker and the setup scripts
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL, QueuePool, "sync"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+monitor_pool(engine, "sync")
+
+# Async engine, used by the API so queries never block the event loop
+async_engine = create_async_engine(
+    get_async_database_url(SQLALCHEMY_DATABASE_URL),
+    **pool_options(SQLALCHEMY_DATABASE_URL, AsyncAdaptedQueuePool, "async"),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+monitor_pool(async_engine.sync_engine, "async")
+
+# Async engine for read-only queries that tolerate replication lag
+if SQLALCHEMY_REPLICA_URL:
+    async_read_engine = create_async_engine(
+        get_async_database_url(SQLALCHEMY_REPLICA_URL),
+        **pool_options(SQLALCHEMY_REPLICA_URL, AsyncAdaptedQueuePool, "async_replica"),
+    )
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+    monitor_pool(async_read_engine.sync_engine, "async_replica")
+else:
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close() 
\ No newline at end of file
+
+if SQLALCHEMY_REPLICA_URL:
+    async def get_read_db():
+        """Session on the read replica"""
+        async with AsyncReadSessionLocal() as db:
+            yield db
+else:
+    # The same dependency, so a request that also authenticates shares one connection
+    get_read_db = get_db
@@ -0,0 +1,257 @@
+"""
+Device registry and heartbeat tracking.
+
+Every event, and every POST /devices/{device_id}/heartbeat, marks its device
+as seen. Sightings are first collected in a dict in the web process. A
+background task moves them to Redis every DEVICE_REDIS_FLUSH_SECONDS, in one
+pipeline:
+
+    devices:last_seen:{user_id}   sorted set, device_id -> last seen (epoch seconds)
+    devices:deadlines             sorted set, "{user_id}:{device_id}" -> when it goes offline
+    devices:pending               hash of the same members -> last seen, not yet in the database
+
+Every DEVICE_DB_FLUSH_SECONDS the pending hash is written to the devices
+table in one upsert. New devices are registered there the same way.
+
+GET /devices/stale reads the silent devices from the front of the per-user
+set, oldest first, in O(log n + stale devices) no matter how many devices
+are healthy. A set lost with Redis is rebuilt from the devices table on the
+next read.
+
+Devices whose deadline passes are claimed from the deadline set
+atomically, so each silence is reported once across web processes. The
+claim ingests a synthetic "device_offline" event for the device. That event
+goes through the normal pipeline, is scored by the alert rules, and reaches
+/ws/alerts and GET /alerts/ like any other alert. The next sighting sets a
+new deadline.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy import bindparam, case, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .database import AsyncSessionLocal
+from .ingest import ingest_events
+from .models import Device, User
+from .redis_client import async_redis_conn
+from .schemas import CurrentUser, EventCreate
+
+logger = logging.getLogger(__name__)
+
+# Silence after which a device gets an offline alert
+DEVICE_OFFLINE_AFTER_SECONDS = float(os.getenv("DEVICE_OFFLINE_AFTER_SECONDS", "300"))
+DEVICE_REDIS_FLUSH_SECONDS = float(os.getenv("DEVICE_REDIS_FLUSH_SECONDS", "1"))
+DEVICE_DB_FLUSH_SECONDS = float(os.getenv("DEVICE_DB_FLUSH_SECONDS", "30"))
+# Most offline devices claimed per pass
+OFFLINE_CLAIM_BATCH = int(os.getenv("DEVICE_OFFLINE_CLAIM_BATCH", "1000"))
+OFFLINE_EVENT_TYPE = "device_offline"
+
+DEADLINES_KEY = "devices:deadlines"
+PENDING_KEY = "devices:pending"
+EPOCH = datetime(1970, 1, 1)
+
+def last_seen_key(user_id: int) -> str:
+    return f"devices:last_seen:{user_id}"
+
+def seeded_key(user_id: int) -> str:
+    """Set once the user's last-seen set holds every registered device"""
+    return f"devices:seeded:{user_id}"
+
+def to_epoch(when: datetime) -> float:
+    return (when - EPOCH).total_seconds()
+
+def from_epoch(seconds: float) -> datetime:
+    return datetime.utcfromtimestamp(seconds)
+
+# Atomically take (and clear) the sightings waiting to be written
+TAKE_PENDING_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return pending
+"""
+
+# Remove and return up to ARGV[2] members whose deadline is at or before ARGV[1]
+CLAIM_OFFLINE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #due, 2 do
+    redis.call('ZREM', KEYS[1], due[i])
+end
+return due
+"""
+
+class DeviceTracker:
+    def __init__(self, redis=async_redis_conn, offline_after: float = DEVICE_OFFLINE_AFTER_SECONDS):
+        self.redis = redis
+        self.offline_after = offline_after
+        self._take_pending = redis.register_script(TAKE_PENDING_SCRIPT)
+        self._claim_offline = redis.register_script(CLAIM_OFFLINE_SCRIPT)
+        # (user_id, device_id) -> last seen, since the last flush to Redis
+        self.sightings: Dict[Tuple[int, str], float] = {}
+
+    def seen(self, user_id: int, device_ids: List[str]):
+        """Record that devices are alive; only touches memory"""
+        now = time.time()
+        for device_id in device_ids:
+            self.sightings[(user_id, device_id)] = now
+
+    async def flush_to_redis(self) -> int:
+        """Move collected sightings to Redis; returns how many devices were seen"""
+        if not self.sightings:
+            return 0
+        sightings, self.sightings = self.sightings, {}
+        by_user: Dict[int, Dict[str, float]] = defaultdict(dict)
+        members = {}
+        for (user_id, device_id), seen_at in sightings.items():
+            by_user[user_id][device_id] = seen_at
+            members[f"{user_id}:{device_id}"] = seen_at
+        pipe = self.redis.pipeline(transaction=False)
+        # GT: another web process may already have a newer sighting
+        for user_id, last_seen in by_user.items():
+            pipe.zadd(last_seen_key(user_id), last_seen, gt=True)
+        pipe.zadd(DEADLINES_KEY, {member: seen_at + self.offline_after for member, seen_at in members.items()},
+                  gt=True)
+        pipe.hset(PENDING_KEY, mapping=members)
+        try:
+            await pipe.execute()
+        except Exception:
+            # Keep them for the next flush, unless the device was seen again since
+            for key, seen_at in sightings.items():
+                self.sightings.setdefault(key, seen_at)
+            raise
+        return len(sightings)
+
+    async def flush_to_database(self) -> int:
+        """Upsert the pending last-seen times into the devices table; returns rows written"""
+        pending = await self._take_pending(keys=[PENDING_KEY])
+        if not pending:
+            return 0
+        rows = []
+        for member, seen_at in zip(pending[::2], pending[1::2]):
+            user_id, device_id = member.decode().split(":", 1)
+            seen_at = from_epoch(float(seen_at))
+            rows.append({"user_id": int(user_id), "device_id": device_id,
+                         "first_seen_at": seen_at, "last_seen_at": seen_at})
+        async with AsyncSessionLocal() as db:
+            await db.execute(upsert_devices(db, rows))
+            await db.commit()
+        return len(rows)
+
+    async def stale_devices(self, db: AsyncSession, user_id: int, silent_for: float) -> List[Tuple[str, datetime]]:
+        """(device_id, last seen) of the user's devices not seen for silent_for seconds, oldest first"""
+        cutoff = time.time() - silent_for
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.exists(seeded_key(user_id))
+        pipe.zrangebyscore(last_seen_key(user_id), "-inf", cutoff, withscores=True)
+        seeded, stale = await pipe.execute()
+        if not seeded:
+            await self._seed(db, user_id)
+            stale = await self.redis.zrangebyscore(last_seen_key(user_id), "-inf", cutoff, withscores=True)
+        return [(device_id.decode(), from_epoch(seen_at)) for device_id, seen_at in stale]
+
+    async def _seed(self, db: AsyncSession, user_id: int):
+        """Load the user's registered devices into their last-seen set"""
+        result = await db.execute(
+            select(Device.device_id, Device.last_seen_at)
+            .where(Device.user_id == user_id, Device.last_seen_at.is_not(None))
+        )
+        last_seen = {device_id: to_epoch(seen_at) for device_id, seen_at in result.all()}
+        pipe = self.redis.pipeline(transaction=False)
+        if last_seen:
+            pipe.zadd(last_seen_key(user_id), last_seen, gt=True)
+        pipe.set(seeded_key(user_id), 1)
+        await pipe.execute()
+
+    async def raise_offline_alerts(self) -> int:
+        """Ingest a device_offline event for every device whose deadline passed; returns how many"""
+        due = await self._claim_offline(keys=[DEADLINES_KEY], args=[time.time(), OFFLINE_CLAIM_BATCH])
+        if not due:
+            return 0
+        offline: Dict[int, List[Tuple[str, datetime]]] = defaultdict(list)
+        for member, deadline in zip(due[::2], due[1::2]):
+            user_id, device_id = member.decode().split(":", 1)
+            offline[int(user_id)].append((device_id, from_epoch(float(deadline) - self.offline_after)))
+
+        ingested: Set[int] = set()
+        try:
+            await self._ingest_offline_events(offline, ingested)
+        except Exception:
+            # Put back the deadlines of users whose events were not stored, so the next pass
+            # retries them, unless the device was seen since
+            retry = {
+                member: float(deadline) for member, deadline in zip(due[::2], due[1::2])
+                if int(member.split(b":", 1)[0]) not in ingested
+            }
+            if retry:
+                await self.redis.zadd(DEADLINES_KEY, retry, gt=True)
+            raise
+        return len(due) // 2
+
+    async def _ingest_offline_events(self, offline: Dict[int, List[Tuple[str, datetime]]], ingested: Set[int]):
+        """Store each user's offline events, adding the user to ingested once they are committed"""
+        now = datetime.utcnow()
+        devices = Device.__table__
+        mark_offline = (
+            update(devices)
+            .where(devices.c.user_id == bindparam("uid"), devices.c.device_id == bindparam("did"))
+            .values(offline_since=now)
+        )
+        async with AsyncSessionLocal() as db:
+            users = (await db.execute(select(User.id, User.email).where(User.id.in_(offline)))).all()
+            for user_id, email in users:
+                events = [
+                    EventCreate(
+                        device_id=device_id,
+                        event_type=OFFLINE_EVENT_TYPE,
+                        confidence=1.0,
+                        raw_data={"last_seen": last_seen.isoformat(), "offline_after_seconds": self.offline_after},
+                    )
+                    for device_id, last_seen in offline[user_id]
+                ]
+                # ingest_events commits, so these events are stored even if a later user fails
+                await ingest_events(db, CurrentUser(id=user_id, email=email), events)
+                ingested.add(user_id)
+                await db.execute(mark_offline, [{"uid": user_id, "did": device_id} for device_id, _ in offline[user_id]])
+                await db.commit()
+
+def upsert_devices(db: AsyncSession, rows: List[dict]):
+    """Register new devices and move last_seen_at forward; a newer sighting clears offline_since"""
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(Device).values(rows)
+    seen_at = stmt.excluded.last_seen_at
+    return stmt.on_conflict_do_update(
+        index_elements=[Device.user_id, Device.device_id],
+        set_={
+            # A device registered without a sighting has no last_seen_at yet
+            "last_seen_at": case((func.coalesce(Device.last_seen_at, EPOCH) < seen_at, seen_at),
+                                 else_=Device.last_seen_at),
+            "offline_since": case((Device.offline_since < seen_at, None), else_=Device.offline_since),
+        },
+    )
+
+device_tracker = DeviceTracker()
+
+async def track_devices(interval: float = DEVICE_REDIS_FLUSH_SECONDS,
+                        db_interval: float = DEVICE_DB_FLUSH_SECONDS):
+    """Background task flushing sightings and raising offline alerts"""
+    next_db_flush = time.monotonic() + db_interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await device_tracker.flush_to_redis()
+            offline = await device_tracker.raise_offline_alerts()
+            if offline:
+                logger.info(f"Raised offline alerts for {offline} devices")
+            if time.monotonic() >= next_db_flush:
+                next_db_flush = time.monotonic() + db_interval
+                await device_tracker.flush_to_database()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Device tracking failed: {e}")
@@ -0,0 +1,221 @@
+"""
+Streaming event ingestion over a WebSocket (/ws/events).
+
+Camera gateways keep one authenticated socket open and stream EventCreate
+objects instead of making an HTTP request per event. A frame is either
+
+- text: one JSON event per line (a line may also hold a JSON array), or
+- binary: a msgpack-encoded event or array of events.
+
+Every event read from the socket gets the next sequence number, starting at
+1. Events are grouped into batches of up to WS_INGEST_BATCH_SIZE, or
+whatever arrived within WS_INGEST_FLUSH_MS, and go through the same ingest
+pipeline as POST /events/batch. Each batch is acknowledged with
+
+    {"type": "ack", "seq": <last seq in batch>, "ids": [...],
+     "errors": [{"seq": <seq>, "detail": "..."}]}
+
+where ids holds one event id per sequence number in the batch (null for
+rejected events) and errors is only present when some were rejected. A
+batch over the rate limits (app/admission.py), or one that found every
+database connection busy, is rejected as a whole; the gateway should resend
+it after the retry time given in the errors. When a processing lane is
+backed up, only the events routed to it are shed. Acks
+use the encoding of the client's latest frame. A text line that is not
+valid JSON takes one sequence number and is rejected like an invalid event;
+the other lines of its frame are stored as usual. A binary frame that
+cannot be decoded is answered with {"type": "error", "detail": "..."} and
+uses no sequence numbers.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional, Tuple, Union
+
+import msgpack
+from fastapi import HTTPException, WebSocket
+from pydantic import ValidationError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from .admission import admit_events
+from .auth import check_device_access
+from .database import AsyncSessionLocal
+from .devices import device_tracker
+from .ingest import ingest_events
+from .schemas import CurrentUser, EventCreate
+from .tasks import classify_events
+
+logger = logging.getLogger(__name__)
+
+# Most events written and acknowledged together
+WS_INGEST_BATCH_SIZE = int(os.getenv("WS_INGEST_BATCH_SIZE", "500"))
+# Longest an event waits for its batch to fill up
+WS_INGEST_FLUSH_MS = float(os.getenv("WS_INGEST_FLUSH_MS", "50"))
+# Batches read ahead of the one being written before the socket stops being read
+WS_INGEST_MAX_PENDING_BATCHES = int(os.getenv("WS_INGEST_MAX_PENDING_BATCHES", "4"))
+
+# (sequence number, parsed event or rejection reason, frame was binary)
+StreamItem = Tuple[int, Union[EventCreate, str], bool]
+
+class FrameError(ValueError):
+    """A frame that could not be decoded"""
+
+def decode_frame(message: dict) -> Tuple[List[object], bool]:
+    """
+    Decode a websocket.receive message into raw event objects. A text line
+    that is not valid JSON becomes a FrameError in place of its events.
+    """
+    if message.get("bytes") is not None:
+        try:
+            payload = msgpack.unpackb(message["bytes"], raw=False)
+        except Exception as e:
+            raise FrameError(f"Invalid msgpack frame: {e}")
+        return (payload if isinstance(payload, list) else [payload]), True
+
+    objects = []
+    for line in (message.get("text") or "").splitlines():
+        if not line.strip():
+            continue
+        try:
+            payload = json.loads(line)
+        except ValueError as e:
+            objects.append(FrameError(f"Invalid JSON line: {e}"))
+            continue
+        objects.extend(payload if isinstance(payload, list) else [payload])
+    return objects, False
+
+def parse_event(user: CurrentUser, obj: object) -> Union[EventCreate, str]:
+    """Validate one raw event, returning it or the reason it was rejected"""
+    if isinstance(obj, FrameError):
+        return str(obj)
+    try:
+        event = EventCreate.model_validate(obj)
+        check_device_access(user, event.device_id)
+    except ValidationError as e:
+        return f"Invalid event: {e.errors()[0]['msg']}"
+    except HTTPException as e:
+        return e.detail
+    return event
+
+class EventStream:
+    """One gateway connection: a reader parsing frames and a writer persisting and acking batches"""
+
+    def __init__(self, websocket: WebSocket, user: CurrentUser,
+                 batch_size: int = WS_INGEST_BATCH_SIZE, flush_ms: float = WS_INGEST_FLUSH_MS):
+        self.websocket = websocket
+        self.user = user
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        # Bounded, so a gateway that outpaces the database stops being read
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=batch_size * WS_INGEST_MAX_PENDING_BATCHES)
+        self.seq = 0
+        self.stored = 0
+        self.open = True
+
+    async def run(self):
+        writer = asyncio.create_task(self._write_batches())
+        try:
+            await self._read_frames()
+        finally:
+            # Persist what was already read even though it can no longer be acked
+            await self.queue.put(None)
+            await writer
+
+    async def _read_frames(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                self.open = False
+                return
+            try:
+                objects, binary = decode_frame(message)
+            except FrameError as e:
+                await self._send({"type": "error", "detail": str(e)}, message.get("bytes") is not None)
+                continue
+            for obj in objects:
+                self.seq += 1
+                await self.queue.put((self.seq, parse_event(self.user, obj), binary))
+
+    async def _next_batch(self) -> Optional[List[StreamItem]]:
+        """Wait for a batch; returns None once the reader is done and the queue is drained"""
+        item = await self.queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            try:
+                item = self.queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self.queue.get(), timeout)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if item is None:
+                # Put the end marker back for the next call
+                self.queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def _write_batches(self):
+        while True:
+            batch = await self._next_batch()
+            if batch is None:
+                return
+            await self._store(batch)
+
+    async def _store(self, batch: List[StreamItem]):
+        positions = [index for index, (_, item, _) in enumerate(batch) if isinstance(item, EventCreate)]
+        events = [batch[index][1] for index in positions]
+        ids: List[Optional[int]] = [None] * len(batch)
+        # Why each item was not stored; invalid events already carry theirs
+        details: List[Optional[str]] = [item if isinstance(item, str) else None for _, item, _ in batch]
+        device_ids = [event.device_id for event in events]
+        device_tracker.seen(self.user.id, device_ids)
+        event_classes = classify_events(events) if events else []
+        rejections = await admit_events(self.user.id, device_ids, [lane for _, lane in event_classes])
+        admitted = [i for i, rejection in enumerate(rejections) if rejection is None]
+        for index, rejection in zip(positions, rejections):
+            if rejection is not None:
+                details[index] = rejection.detail
+        if admitted:
+            try:
+                async with AsyncSessionLocal() as db:
+                    responses = await ingest_events(
+                        db, self.user, [events[i] for i in admitted], [event_classes[i] for i in admitted]
+                    )
+                for i, response in zip(admitted, responses):
+                    ids[positions[i]] = response.id
+                self.stored += len(admitted)
+            except PoolTimeoutError:
+                logger.warning(f"Database pool exhausted storing streamed events for user {self.user.id}")
+                for i in admitted:
+                    details[positions[i]] = "Database busy, retry later"
+            except Exception as e:
+                logger.error(f"Error storing streamed events for user {self.user.id}: {e}")
+                for i in admitted:
+                    details[positions[i]] = f"Failed to create event: {e}"
+
+        errors = [{"seq": seq, "detail": detail} for (seq, _, _), detail in zip(batch, details) if detail is not None]
+        ack = {"type": "ack", "seq": batch[-1][0], "ids": ids}
+        if errors:
+            ack["errors"] = errors
+        await self._send(ack, batch[-1][2])
+
+    async def _send(self, message: dict, binary: bool):
+        if not self.open:
+            return
+        try:
+            if binary:
+                await self.websocket.send_bytes(msgpack.packb(message))
+            else:
+                await self.websocket.send_text(json.dumps(message))
+        except Exception as e:
+            logger.info(f"Event stream for user {self.user.id} closed while acking: {e}")
+            self.open = False
+
+async def stream_events(websocket: WebSocket, user: CurrentUser) -> int:
+    """Serve an accepted ingest socket until the client disconnects; returns events stored"""
+    stream = EventStream(websocket, user)
+    await stream.run()
+    return stream.stored
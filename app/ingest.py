@@ -0,0 +1,116 @@
+"""
+Shared ingest pipeline for camera events: coalesce, persist, enqueue.
+"""
+import logging
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .blob_store import offload_payloads
+from .metrics import DB_SECONDS
+from .coalescing import Claim, DEDUP_ENABLED, coalescer
+from .models import Event
+from .schemas import CurrentUser, EventCreate, EventResponse
+from .tasks import classify_events, enqueue_event_jobs
+
+logger = logging.getLogger(__name__)
+
+async def coalesce_events(user: CurrentUser, events: List[EventCreate], classes: List[str]) -> List[Claim]:
+    """Run events through the dedup window; fails open if Redis is unavailable"""
+    if DEDUP_ENABLED:
+        try:
+            return await coalescer.claim(user.id, events, classes)
+        except Exception as e:
+            logger.error(f"Event coalescing unavailable, storing every event: {e}")
+    return [Claim(key="", count=1, max_confidence=event.confidence) for event in events]
+
+async def enqueue_events(events: List[EventResponse], lanes: List[str]):
+    """Queue events for processing on their priority lanes in one pipelined call"""
+    if not events:
+        return
+    try:
+        queued = await run_in_threadpool(enqueue_event_jobs, events, lanes)
+        logger.info("Queued events for processing: %s", queued)
+    except Exception as e:
+        logger.error(f"Failed to queue events for processing: {e}")
+        # Don't raise here, as the events were already created
+
+async def ingest_events(db: AsyncSession, user: CurrentUser, events: List[EventCreate],
+                        event_classes: Optional[List[Tuple[Optional[str], str]]] = None) -> List[EventResponse]:
+    """
+    Store and enqueue a list of events, returning one response per event.
+    Duplicates inside the coalescing window are merged into the first event
+    of their burst: they are neither stored nor enqueued, and their response
+    describes that event. Events are scored up front, so a duplicate that
+    the rules rate higher than its burst starts a new one; pass
+    event_classes when the caller already has them from classify_events.
+    """
+    if event_classes is None:
+        event_classes = classify_events(events)
+    claims = await coalesce_events(user, events, [f"{severity}:{lane}" for severity, lane in event_classes])
+
+    # Insert the first event of every new burst in one round-trip
+    now = datetime.utcnow()
+    leaders = {}
+    lanes = {}
+    for event, claim, (_, lane) in zip(events, claims, event_classes):
+        if not claim.is_duplicate and id(claim) not in leaders:
+            leaders[id(claim)] = (event, claim)
+            lanes[id(claim)] = lane
+    # Large payloads go to the blob store; the rows keep their hash and size
+    payloads = []
+    if leaders:
+        payloads = await run_in_threadpool(offload_payloads, [event.raw_data for event, claim in leaders.values()])
+    rows = [
+        {
+            "device_id": event.device_id,
+            "event_type": event.event_type,
+            "confidence": event.confidence,
+            "timestamp": now,
+            "location": event.location,
+            "raw_data": raw_data,
+            "raw_data_hash": raw_data_hash,
+            "raw_data_size": raw_data_size,
+            "user_id": user.id,
+            "occurrence_count": claim.count,
+            "max_confidence": claim.max_confidence,
+        }
+        for (event, claim), (raw_data, raw_data_hash, raw_data_size) in zip(leaders.values(), payloads)
+    ]
+    created = {}
+    if rows:
+        with DB_SECONDS.labels("insert_events").time():
+            db_events = (await db.scalars(insert(Event).returning(Event, sort_by_parameter_order=True), rows)).all()
+            await db.commit()
+        for (event, claim), db_event in zip(leaders.values(), db_events):
+            created[id(claim)] = EventResponse.model_validate(db_event)
+        if DEDUP_ENABLED:
+            try:
+                await coalescer.register(
+                    [(claim, created[id(claim)].id, now) for event, claim in leaders.values() if claim.key]
+                )
+            except Exception as e:
+                logger.error(f"Failed to register coalescing windows: {e}")
+
+    await enqueue_events(list(created.values()), [lanes[claim_id] for claim_id in created])
+
+    responses = []
+    for event, claim in zip(events, claims):
+        if id(claim) in created:
+            responses.append(created[id(claim)])
+        else:
+            responses.append(EventResponse(
+                device_id=event.device_id,
+                event_type=event.event_type,
+                confidence=event.confidence,
+                location=event.location,
+                id=claim.event_id,
+                timestamp=claim.timestamp,
+                user_id=user.id,
+                occurrence_count=claim.count,
+                max_confidence=claim.max_confidence,
+            ))
+    return responses
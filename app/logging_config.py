@@ -0,0 +1,107 @@
+"""
+Non-blocking, sampled logging.
+
+configure_logging() sends every record through a bounded in-memory queue to
+a background listener thread, which does the formatting and the writes. The
+thread that logs only builds the record. Messages are formatted from their
+%-style arguments in the listener, so hot paths should log with
+logger.info("... %s", value) rather than f-strings.
+
+High-volume routes are sampled per request. LOG_SAMPLE_RATES maps request
+paths to the fraction of requests whose INFO and DEBUG records are kept, e.g.
+
+    LOG_SAMPLE_RATES="/events/=0.01,/events/batch=0.1"
+
+A sampled request keeps all of its records. Warnings and errors are always
+kept. Paths without a rate are not sampled.
+
+LOG_FORMAT=json writes one JSON object per line instead of plain text.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from .metrics import LOG_RECORDS_DROPPED
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+# Records waiting for the listener; once full, new records are dropped rather than blocking
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        path, _, rate = item.strip().rpartition("=")
+        if path:
+            rates[path] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "/events/=0.01,/events/batch=0.1"))
+
+# Whether the current request's INFO and DEBUG records are kept
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+def sample_request(path: str) -> bool:
+    """Decide whether to keep the low-level logs of a request to this path"""
+    rate = LOG_SAMPLE_RATES.get(path)
+    sampled = rate is None or random.random() < rate
+    _sampled.set(sampled)
+    return sampled
+
+class SamplingFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the listener unformatted, dropping them if it falls behind"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The queue never leaves the process, so formatting can wait for the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+_listener: Optional[QueueListener] = None
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Route the root logger through the background listener; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT))
+
+    handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    # Write out whatever is still queued when the process exits
+    atexit.register(_listener.stop)
@@ -1,27 +1,59 @@
-from fastapi import FastAPI, Depends, HTTPException, WebSocket
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
-import json
+from functools import partial
+from typing import Dict, Optional
+import asyncio
 import logging
-import jwt
+import orjson
 import os
+import time
 
-from .database import get_db
-from .models import Event, Alert
-from .schemas import EventCreate, EventResponse, AlertResponse, Token
-from .auth import get_current_user, authenticate_user, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY, ALGORITHM
-from .tasks import process_event
-from .websocket_manager import active_connections
+from .database import get_db, get_read_db, AsyncSessionLocal, DB_POOL_TIMEOUT
+from .models import Alert, Device, DeviceApiKey, Event
+from .schemas import EventCreate, EventResponse, AlertResponse, AlertStats, QueueLaneStats, Token, DeviceApiKeyCreated, DeviceApiKeyResponse, DeviceResponse, StaleDevice
+from .auth import (
+    get_current_user, get_ingest_user, check_device_access, verify_token, verify_api_key, authenticate_user,
+    create_access_token, generate_api_key, hash_api_key, ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from .redis_client import async_redis_conn, redis_url
+from .admission import enforce_admission
+from .alert_cache import ALERT_CACHE_SIZE, cacheable, fill_alert_cache, read_cached_alerts
+from .alert_stats import MAX_STATS_HOURS, read_alert_stats
+from .blob_store import BlobNotFound, load_payload
+from .metrics import (
+    ALERT_CACHE_READS, DB_SECONDS, HTTP_REQUEST_SECONDS, QUEUE_DEPTH, QUEUE_OLDEST_WAIT_SECONDS
+)
+from .coalescing import flush_coalesced_events
+from .devices import device_tracker, track_devices
+from .event_stream import stream_events
+from .ingest import ingest_events
+from .logging_config import configure_logging, sample_request
+from .pubsub import listen_for_alerts, replay_alerts
+from .responses import events_response, json_array_response, response_columns, rows_response
+from .tasks import classify_events, lane_stats
+from .websocket_manager import ALERT_FORMATS, manager
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Get port from environment variable
 PORT = int(os.getenv("PORT", "7001"))
 
+# Upper bound on the number of events accepted by a single batch request
+MAX_EVENT_BATCH_SIZE = int(os.getenv("MAX_EVENT_BATCH_SIZE", "1000"))
+
+# Columns of GET /alerts/, fetched as plain rows rather than Alert instances
+ALERT_COLUMNS = response_columns(Alert, AlertResponse)
+
 app = FastAPI(title="Camera Alert System")
 
 # CORS middleware
@@ -34,6 +66,70 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+@app.middleware("http")
+async def sample_request_logs(request: Request, call_next):
+    """Keep or drop the INFO logs of this request as a whole, per LOG_SAMPLE_RATES"""
+    sample_request(request.url.path)
+    return await call_next(request)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Observe every request's latency under its route template, e.g. /events/{event_id}/raw_data"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - start)
+    return response
+
+@app.exception_handler(PoolTimeoutError)
+async def database_busy(request: Request, exc: PoolTimeoutError):
+    """Every pooled connection stayed in use for DB_POOL_TIMEOUT; tell the client to back off"""
+    if isinstance(request, WebSocket):
+        # Raised while authenticating a socket, before it was accepted
+        logger.warning(f"Database pool exhausted on WebSocket {request.url.path}")
+        await request.close(code=1013, reason="Database busy, retry later")
+        return
+    logger.warning(f"Database pool exhausted on {request.method} {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, retry later"},
+        headers={"Retry-After": str(max(1, round(DB_POOL_TIMEOUT)))},
+    )
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics of this web process, plus the depth of every processing lane"""
+    def collect():
+        try:
+            for lane, stats in lane_stats().items():
+                QUEUE_DEPTH.labels(lane).set(stats["depth"])
+                QUEUE_OLDEST_WAIT_SECONDS.labels(lane).set(stats["oldest_wait_seconds"])
+        except Exception as e:
+            logger.error(f"Failed to read queue depths for metrics: {e}")
+        return generate_latest()
+    return Response(await run_in_threadpool(collect), media_type=CONTENT_TYPE_LATEST)
+
+# Long-running background tasks owned by this web process
+background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Forward worker alerts from Redis to local WebSockets
+    background_tasks.append(asyncio.create_task(listen_for_alerts(redis_url)))
+    # Fold coalesced duplicate counts into the events table
+    background_tasks.append(asyncio.create_task(flush_coalesced_events()))
+    # Flush device sightings and raise offline alerts
+    background_tasks.append(asyncio.create_task(track_devices()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
 @app.websocket("/ws/alerts")
 async def websocket_endpoint(websocket: WebSocket):
     try:
@@ -43,15 +139,17 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.close(code=4001, reason="No token provided")
             return
 
-        # Verify token and get user
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            email: str = payload.get("sub")
-            if email is None:
-                await websocket.close(code=4001, reason="Invalid token")
-                return
-        except jwt.JWTError as e:
-            logger.error(f"JWT error: {e}")
+        # Optional protocol: ?format=json|msgpack&batch_ms=<n> (see ClientConnection)
+        alert_format = websocket.query_params.get("format", "json")
+        batch_ms = websocket.query_params.get("batch_ms", "0")
+        if alert_format not in ALERT_FORMATS or not batch_ms.isdigit():
+            await websocket.close(code=4002, reason="Unsupported format or batch_ms")
+            return
+
+        # Verify token and get user, sharing the HTTP verification path and cache
+        async with AsyncSessionLocal() as db:
+            user = await verify_token(token, db)
+        if user is None:
             await websocket.close(code=4001, reason="Invalid token")
             return
 
@@ -63,9 +161,16 @@ async def websocket_endpoint(websocket: WebSocket):
             "Access-Control-Allow-Credentials": "true",
         }
         
-        await websocket.accept(headers=headers)
-        active_connections.append(websocket)
-        logger.info(f"WebSocket connection accepted for user {email}")
+        # ASGI wants the handshake headers as (name, value) byte pairs
+        await websocket.accept(headers=[(name.encode(), value.encode()) for name, value in headers.items()])
+
+        # A reconnecting client passes the last alert it saw to get what it missed
+        replay = None
+        last_alert_id = websocket.query_params.get("last_alert_id")
+        if last_alert_id and last_alert_id.isdigit():
+            replay = partial(replay_alerts, async_redis_conn, user.id, int(last_alert_id))
+        connection = manager.connect(websocket, user.id, replay, alert_format, int(batch_ms))
+        logger.info(f"WebSocket connection accepted for user {user.email}")
         
         try:
             while True:
@@ -75,18 +180,49 @@ async def websocket_endpoint(websocket: WebSocket):
         except Exception as e:
             logger.error(f"WebSocket error: {e}")
         finally:
-            active_connections.remove(websocket)
-            logger.info(f"WebSocket connection closed for user {email}")
+            manager.disconnect(connection)
+            logger.info(f"WebSocket connection closed for user {user.email}")
     except Exception as e:
         logger.error(f"WebSocket connection error: {e}")
         await websocket.close(code=4001, reason="Connection error")
 
+@app.websocket("/ws/events")
+async def event_stream_endpoint(websocket: WebSocket):
+    """
+    Streaming ingest for camera gateways (see app/event_stream.py).
+    Authenticates with a device API key (X-API-Key header or `api_key`
+    query parameter) or a bearer token (Authorization header or `token`).
+    """
+    api_key = websocket.headers.get("x-api-key") or websocket.query_params.get("api_key")
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+
+    user = None
+    async with AsyncSessionLocal() as db:
+        if api_key:
+            user = await verify_api_key(api_key, db)
+        elif token:
+            user = await verify_token(token, db)
+    if user is None:
+        await websocket.close(code=4001, reason="Invalid credentials")
+        return
+
+    await websocket.accept()
+    logger.info(f"Event stream opened for user {user.id}" + (f" device {user.device_id}" if user.device_id else ""))
+    try:
+        stored = await stream_events(websocket, user)
+        logger.info(f"Event stream closed for user {user.id} after {stored} events")
+    except Exception as e:
+        logger.error(f"Event stream error for user {user.id}: {e}")
+
 @app.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -102,39 +238,29 @@ async def login_for_access_token(
 @app.post("/events/", response_model=EventResponse)
 async def create_event(
     event: EventCreate,
-    db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_ingest_user)
 ):
+    check_device_access(current_user, event.device_id)
+    device_tracker.seen(current_user.id, [event.device_id])
+    # Routed up front, so only a backlog on this event's own lane sheds it
+    event_classes = classify_events([event])
+    await enforce_admission(current_user.id, [event.device_id], [lane for _, lane in event_classes])
     try:
-        logger.info(f"Creating event for user {current_user.id}")
-        logger.info(f"Event data: {json.dumps(event.dict(), indent=2)}")
-        
-        # Create event in database
-        db_event = Event(
-            device_id=event.device_id,
-            event_type=event.event_type,
-            confidence=event.confidence,
-            timestamp=datetime.utcnow(),
-            raw_data=event.raw_data,
-            user_id=current_user.id
-        )
-        db.add(db_event)
-        db.commit()
-        db.refresh(db_event)
-        
-        logger.info(f"Event created with ID: {db_event.id}")
+        # Create event in database and queue it for processing
+        db_event = (await ingest_events(db, current_user, [event], event_classes))[0]
 
-        # Queue event for processing
-        try:
-            from .tasks import queue, process_event
-            # Enqueue the event for processing
-            job = queue.enqueue(process_event, db_event.id)
-            logger.info(f"Event {db_event.id} queued for processing with job ID: {job.id}")
-        except Exception as e:
-            logger.error(f"Failed to queue event for processing: {e}")
-            # Don't raise here, as the event was already created
+        # Hot path: logged lazily and sampled, see logging_config
+        if db_event.occurrence_count > 1:
+            logger.info("Event from user %s coalesced into ID: %s (%s occurrences)",
+                        current_user.id, db_event.id, db_event.occurrence_count)
+        else:
+            logger.info("Event from user %s created with ID: %s", current_user.id, db_event.id)
 
         return db_event
+    except PoolTimeoutError:
+        # Answered with 503 by database_busy
+        raise
     except Exception as e:
         logger.error(f"Error creating event: {e}")
         raise HTTPException(
@@ -142,21 +268,247 @@ async def create_event(
             detail=f"Failed to create event: {str(e)}"
         )
 
+@app.post("/events/batch", response_model=list[EventResponse])
+async def create_events_batch(
+    events: list[EventCreate],
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_ingest_user)
+):
+    """
+    Create many events at once.
+    All new events are written with a single multi-row INSERT ... RETURNING
+    and enqueued for processing with a single pipelined Redis call.
+    """
+    if not events:
+        return []
+    if len(events) > MAX_EVENT_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: at most {MAX_EVENT_BATCH_SIZE} events per request"
+        )
+    for event in events:
+        check_device_access(current_user, event.device_id)
+    device_tracker.seen(current_user.id, [event.device_id for event in events])
+    event_classes = classify_events(events)
+    await enforce_admission(current_user.id, [event.device_id for event in events],
+                            [lane for _, lane in event_classes])
+
+    try:
+        response = await ingest_events(db, current_user, events, event_classes)
+        logger.info("Created events from batch of %s for user %s", len(events), current_user.id)
+        return events_response(response)
+    except PoolTimeoutError:
+        # Answered with 503 by database_busy
+        raise
+    except Exception as e:
+        logger.error(f"Error creating events: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to create events: {str(e)}"
+        )
+
+@app.get("/events/{event_id}/raw_data")
+async def get_event_raw_data(
+    event_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """An event's full raw_data payload, from its row or from the blob store"""
+    result = await db.execute(
+        select(Event.raw_data, Event.raw_data_hash)
+        .where(Event.id == event_id, Event.user_id == current_user.id)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Event not found")
+    if row.raw_data_hash is None:
+        return row.raw_data
+    try:
+        return await run_in_threadpool(load_payload, row.raw_data_hash)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Event payload is no longer stored")
+
+def parse_alert_cursor(cursor: str):
+    """Parse a `<created_at>,<id>` keyset cursor"""
+    try:
+        created_at, alert_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(alert_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected <created_at>,<id>")
+
+def format_alert_cursor(alert) -> str:
+    return f"{alert.created_at.isoformat()},{alert.id}"
+
 @app.get("/alerts/", response_model=list[AlertResponse])
 async def get_alerts(
     skip: int = 0,
     limit: int = 100,
     severity: str = None,
-    db: Session = Depends(get_db),
+    before: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    query = db.query(Alert).filter(Alert.user_id == current_user.id)
+    """
+    List the current user's alerts, newest first.
+    Pass the X-Next-Cursor header of a page as `before` to fetch the next
+    one; unlike `skip`, cursor pages cost the same however deep they are.
+    Reads from the replica when DATABASE_REPLICA_URL is set, so the newest
+    alerts may show up a moment later here than on /ws/alerts.
+    Rows skip the ORM and response validation, see app/responses.py.
+    First pages are served from the recent alerts cache, see app/alert_cache.py.
+    """
+    use_cache = before is None and cacheable(skip, limit)
+    if use_cache:
+        try:
+            cached = await read_cached_alerts(async_redis_conn, current_user.id, severity, skip, limit)
+        except Exception as e:
+            logger.error(f"Alert cache unavailable: {e}")
+            ALERT_CACHE_READS.labels("error").inc()
+            use_cache = False
+        else:
+            ALERT_CACHE_READS.labels("hit" if cached is not None else "miss").inc()
+            if cached is not None:
+                headers = {}
+                if len(cached) == limit:
+                    last = orjson.loads(cached[-1])
+                    headers["X-Next-Cursor"] = f"{last['created_at']},{last['id']}"
+                return json_array_response(cached, headers)
+
+    query = select(*ALERT_COLUMNS).where(Alert.user_id == current_user.id)
     
     if severity:
-        query = query.filter(Alert.severity == severity)
+        query = query.where(Alert.severity == severity)
+
+    if before:
+        query = query.where(tuple_(Alert.created_at, Alert.id) < parse_alert_cursor(before))
     
-    alerts = query.order_by(Alert.created_at.desc()).offset(skip).limit(limit).all()
-    return alerts
+    query = query.order_by(Alert.created_at.desc(), Alert.id.desc())
+    # A cache miss reads the whole cacheable range, to fill the cache and slice the page from it
+    query = query.limit(ALERT_CACHE_SIZE) if use_cache else query.offset(skip).limit(limit)
+    with DB_SECONDS.labels("list_alerts").time():
+        result = await db.execute(query)
+    alerts = result.all()
+    if use_cache:
+        try:
+            await fill_alert_cache(async_redis_conn, current_user.id, severity, [row._asdict() for row in alerts])
+        except Exception as e:
+            logger.error(f"Failed to fill alert cache: {e}")
+        alerts = alerts[skip:skip + limit]
+    headers = {}
+    if alerts and len(alerts) == limit:
+        headers["X-Next-Cursor"] = format_alert_cursor(alerts[-1])
+    return rows_response(alerts, headers)
+
+@app.get("/alerts/stats", response_model=AlertStats)
+async def get_alert_stats(
+    hours: int = Query(24, ge=1, le=MAX_STATS_HOURS),
+    current_user = Depends(get_current_user)
+):
+    """
+    Alert counts for the current user by severity, by device and per hour
+    over the last `hours` hours. Served from counters the workers maintain
+    in Redis, so the cost does not grow with the alerts table.
+    """
+    return await read_alert_stats(async_redis_conn, current_user.id, hours)
+
+@app.get("/queues", response_model=Dict[str, QueueLaneStats])
+async def get_queue_stats(current_user = Depends(get_current_user)):
+    """Backlog of each event processing lane: queued jobs and the age of the oldest"""
+    return await run_in_threadpool(lane_stats)
+
+@app.get("/devices/", response_model=list[DeviceResponse])
+async def list_devices(
+    db: AsyncSession = Depends(get_read_db),
+    current_user = Depends(get_current_user)
+):
+    """Registered devices; last_seen_at lags live sightings by up to DEVICE_DB_FLUSH_SECONDS"""
+    result = await db.execute(
+        select(Device).where(Device.user_id == current_user.id).order_by(Device.device_id)
+    )
+    return result.scalars().all()
+
+@app.get("/devices/stale", response_model=list[StaleDevice])
+async def list_stale_devices(
+    minutes: float = Query(5, gt=0),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Devices that have sent nothing for `minutes`, longest silent first"""
+    stale = await device_tracker.stale_devices(db, current_user.id, minutes * 60)
+    return [StaleDevice(device_id=device_id, last_seen=last_seen) for device_id, last_seen in stale]
+
+@app.post("/devices/{device_id}/heartbeat", status_code=204)
+async def device_heartbeat(
+    device_id: str,
+    current_user = Depends(get_ingest_user)
+):
+    """Tell the server a device is alive without sending an event"""
+    check_device_access(current_user, device_id)
+    device_tracker.seen(current_user.id, [device_id])
+
+@app.post("/devices/{device_id}/api-keys", response_model=DeviceApiKeyCreated)
+async def create_device_api_key(
+    device_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Issue an API key for a device. The key is only returned here; the server
+    keeps its HMAC. Devices send it in the X-API-Key header.
+    """
+    api_key = generate_api_key()
+    db_key = DeviceApiKey(
+        device_id=device_id,
+        key_hash=hash_api_key(api_key),
+        key_prefix=api_key[:12],
+        created_at=datetime.utcnow(),
+        user_id=current_user.id
+    )
+    db.add(db_key)
+    await db.commit()
+    logger.info(f"Issued API key {db_key.key_prefix}... for device {device_id}")
+    return DeviceApiKeyCreated(
+        id=db_key.id,
+        device_id=db_key.device_id,
+        key_prefix=db_key.key_prefix,
+        created_at=db_key.created_at,
+        api_key=api_key
+    )
+
+@app.get("/devices/{device_id}/api-keys", response_model=list[DeviceApiKeyResponse])
+async def list_device_api_keys(
+    device_id: str,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    result = await db.execute(
+        select(DeviceApiKey).where(
+            DeviceApiKey.user_id == current_user.id,
+            DeviceApiKey.device_id == device_id,
+            DeviceApiKey.revoked_at.is_(None)
+        )
+    )
+    return result.scalars().all()
+
+@app.delete("/devices/{device_id}/api-keys/{key_id}", status_code=204)
+async def revoke_device_api_key(
+    device_id: str,
+    key_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    result = await db.execute(
+        select(DeviceApiKey).where(
+            DeviceApiKey.id == key_id,
+            DeviceApiKey.user_id == current_user.id,
+            DeviceApiKey.device_id == device_id
+        )
+    )
+    db_key = result.scalars().first()
+    if db_key is None:
+        raise HTTPException(status_code=404, detail="API key not found")
+    db_key.revoked_at = datetime.utcnow()
+    await db.commit()
 
 @app.get("/")
 async def root():
@@ -0,0 +1,89 @@
+"""
+Prometheus metrics for the event pipeline.
+
+The web process serves them on GET /metrics; batch workers serve their own
+on WORKER_METRICS_PORT. Together they trace an event from the camera's
+request to the alert reaching a browser:
+
+    request -> database insert -> RQ enqueue -> queue wait -> processing
+            -> alert created -> WebSocket send
+
+Every alert carries its event's ingest time (`ingested_at`), so the web
+process can observe the full ingest-to-delivery latency when it sends it.
+Database pool gauges (db_pool_checked_out / db_pool_capacity) show how close
+each process is to running out of connections.
+"""
+import os
+from datetime import datetime
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Fast paths are in the low milliseconds; end-to-end latency can reach seconds under backlog
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+DB_SECONDS = Histogram(
+    "db_query_duration_seconds", "Time spent in database calls on the request path",
+    ["operation"], buckets=LATENCY_BUCKETS,
+)
+ENQUEUE_SECONDS = Histogram(
+    "rq_enqueue_duration_seconds", "Time to enqueue a request's events on their lanes",
+    buckets=LATENCY_BUCKETS,
+)
+EVENTS_COALESCED = Counter(
+    "events_coalesced_total", "Duplicate events merged into an earlier event instead of being stored",
+)
+EVENTS_ENQUEUED = Counter("events_enqueued_total", "Events queued for processing", ["lane"])
+QUEUE_WAIT_SECONDS = Histogram(
+    "rq_queue_wait_seconds", "Time an event's job waited in its queue", ["lane"], buckets=LATENCY_BUCKETS,
+)
+PROCESS_SECONDS = Histogram(
+    "process_events_duration_seconds", "Time to score, store and publish one batch of events",
+    buckets=LATENCY_BUCKETS,
+)
+EVENTS_PROCESSED = Counter("events_processed_total", "Events turned into alerts")
+EVENT_TO_ALERT_SECONDS = Histogram(
+    "event_to_alert_seconds", "Time from ingesting an event to creating its alert", ["severity"],
+    buckets=LATENCY_BUCKETS,
+)
+WS_SEND_SECONDS = Histogram(
+    "websocket_send_duration_seconds", "Time to send one frame to an alert WebSocket",
+    buckets=LATENCY_BUCKETS,
+)
+WS_CONNECTIONS = Gauge("websocket_connections", "Open alert WebSocket connections")
+INGEST_TO_DELIVERY_SECONDS = Histogram(
+    "ingest_to_delivery_seconds", "Time from ingesting an event to sending its alert to a WebSocket",
+    buckets=LATENCY_BUCKETS,
+)
+QUEUE_DEPTH = Gauge("rq_queue_depth", "Jobs waiting in each lane", ["lane"])
+QUEUE_OLDEST_WAIT_SECONDS = Gauge("rq_queue_oldest_wait_seconds", "Age of the oldest job in each lane", ["lane"])
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from a database pool", ["pool"], buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter("db_pool_timeouts_total", "Checkouts that gave up waiting for a connection", ["pool"])
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Connections of a database pool in use", ["pool"])
+INGEST_REJECTED = Counter(
+    "ingest_rejected_events_total", "Events turned away by admission control, by reason", ["reason"],
+)
+ALERT_CACHE_READS = Counter(
+    "alert_cache_reads_total", "First-page GET /alerts/ reads by cache result (hit, miss, error)", ["result"],
+)
+AUTH_CACHE_READS = Counter(
+    "auth_cache_reads_total", "Credential lookups by cache (token, api_key) and result (hit, miss)",
+    ["cache", "result"],
+)
+AUTH_CACHE_ENTRIES = Gauge("auth_cache_entries", "Verified credentials held by each cache", ["cache"])
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+DB_POOL_CAPACITY = Gauge("db_pool_capacity", "Most connections a database pool may open", ["pool"])
+
+def seconds_since(timestamp: Optional[str]) -> Optional[float]:
+    """Seconds between a naive UTC ISO timestamp and now, or None if it is missing"""
+    if not timestamp:
+        return None
+    return (datetime.utcnow() - datetime.fromisoformat(timestamp)).total_seconds()
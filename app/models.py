@@ -1,7 +1,13 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Index, UniqueConstraint
+from sqlalchemy.orm import deferred, relationship
 from datetime import datetime
-from .database import Base
+from .database import Base, engine
+
+# On PostgreSQL events and alerts are partitioned by day (migration 0002). The
+# primary key of a partitioned table must include its partition column, and
+# alerts.event_id cannot reference events. Other databases keep plain tables
+# keyed on id alone.
+PARTITIONED = engine.dialect.name == "postgresql"
 
 class User(Base):
     __tablename__ = "users"
@@ -11,30 +17,90 @@ class User(Base):
     hashed_password = Column(String)
     events = relationship("Event", back_populates="user")
     alerts = relationship("Alert", back_populates="user")
+    device_api_keys = relationship("DeviceApiKey", back_populates="user")
+    devices = relationship("Device", back_populates="user")
 
 class Event(Base):
     __tablename__ = "events"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     device_id = Column(String, index=True)
     event_type = Column(String)
     confidence = Column(Float)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    raw_data = Column(JSON)
+    timestamp = Column(DateTime, default=datetime.utcnow, primary_key=PARTITIONED)
+    location = Column(String)  # copied from raw_data for scoring
+    # Only loaded on access; payloads over RAW_DATA_INLINE_MAX_BYTES are kept
+    # in the blob store instead (app/blob_store.py) and this is NULL
+    raw_data = deferred(Column(JSON))
+    raw_data_hash = Column(String(64))  # SHA-256 of the offloaded payload
+    raw_data_size = Column(Integer)
     user_id = Column(Integer, ForeignKey("users.id"))
+    occurrence_count = Column(Integer, default=1, server_default="1")  # duplicates coalesced into this event
+    max_confidence = Column(Float)  # highest confidence across coalesced duplicates
     
     user = relationship("User", back_populates="events")
-    alert = relationship("Alert", back_populates="event", uselist=False)
+    alert = relationship("Alert", primaryjoin="Event.id == foreign(Alert.event_id)",
+                         back_populates="event", uselist=False)
 
 class Alert(Base):
     __tablename__ = "alerts"
 
-    id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, ForeignKey("events.id"))
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    event_id = Column(Integer, index=True)
     severity = Column(String)  # "critical", "normal"
     description = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow, primary_key=PARTITIONED)
+    user_id = Column(Integer, ForeignKey("users.id"))
+
+    event = relationship("Event", primaryjoin="foreign(Alert.event_id) == Event.id", back_populates="alert")
+    user = relationship("User", back_populates="alerts")
+
+    __table_args__ = (
+        # Serve GET /alerts/ (with or without a severity filter) from one index range scan
+        Index("ix_alerts_user_severity_created_id", "user_id", "severity", "created_at", "id"),
+        Index("ix_alerts_user_created_id", "user_id", "created_at", "id"),
+    ) 
+
+class DeviceApiKey(Base):
+    __tablename__ = "device_api_keys"
+
+    id = Column(Integer, primary_key=True, index=True)
+    device_id = Column(String, index=True)
+    key_hash = Column(String, unique=True, index=True)  # HMAC-SHA256 of the key
+    key_prefix = Column(String)  # first characters of the key, for identification
     created_at = Column(DateTime, default=datetime.utcnow)
+    revoked_at = Column(DateTime, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
 
-    event = relationship("Event", back_populates="alert")
-    user = relationship("User", back_populates="alerts") 
\ No newline at end of file
+    user = relationship("User", back_populates="device_api_keys")
+
+# Devices register themselves by sending events or heartbeats (app/devices.py)
+class Device(Base):
+    __tablename__ = "devices"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    device_id = Column(String, nullable=False)
+    first_seen_at = Column(DateTime, default=datetime.utcnow)
+    last_seen_at = Column(DateTime)  # flushed from Redis in bulk, so up to DEVICE_DB_FLUSH_SECONDS behind
+    offline_since = Column(DateTime, nullable=True)  # set with the offline alert, cleared by the next heartbeat
+
+    user = relationship("User", back_populates="devices")
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "device_id", name="uq_devices_user_device"),
+        Index("ix_devices_user_last_seen", "user_id", "last_seen_at"),
+    )
+
+
+# Per-device hourly event counts, kept after the raw event partitions expire
+class EventRollup(Base):
+    __tablename__ = "event_rollups_hourly"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    device_id = Column(String, primary_key=True)
+    event_type = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # start of the hour
+    event_count = Column(Integer, nullable=False)
+    max_confidence = Column(Float)
+    sum_confidence = Column(Float)  # duplicates counted at their burst leader's confidence
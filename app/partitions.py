@@ -0,0 +1,279 @@
+"""
+Time partitioning, retention and rollups for the events and alerts tables.
+
+On PostgreSQL both tables are declaratively partitioned by day (events on
+timestamp, alerts on created_at; see alembic migration 0002). This module
+creates upcoming partitions, compacts expiring event partitions into
+per-device hourly rows in event_rollups_hourly, and drops partitions (and
+offloaded event payloads) older than the retention window. Rows that land in
+a table's default partition, because maintenance stopped for longer than
+PARTITION_DAYS_AHEAD, are moved into daily partitions on the next pass.
+Run it periodically:
+
+    python -m app.partitions                 # one maintenance pass
+    python -m app.partitions --interval 3600 # keep running, once an hour
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from .blob_store import blob_store
+from .database import engine
+from .logging_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+# Partitioned tables and the column each is partitioned on
+PARTITIONED_TABLES: Dict[str, str] = {
+    "events": "timestamp",
+    "alerts": "created_at",
+}
+
+# Non-unique indexes recreated on the partitioned tables
+PARTITIONED_INDEXES: Dict[str, Dict[str, List[str]]] = {
+    "events": {
+        "ix_events_id": ["id"],
+        "ix_events_device_id": ["device_id"],
+    },
+    "alerts": {
+        "ix_alerts_id": ["id"],
+        "ix_alerts_event_id": ["event_id"],
+        "ix_alerts_user_severity_created_id": ["user_id", "severity", "created_at", "id"],
+        "ix_alerts_user_created_id": ["user_id", "created_at", "id"],
+    },
+}
+
+EVENT_RETENTION_DAYS = int(os.getenv("EVENT_RETENTION_DAYS", "30"))
+ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "90"))
+PARTITION_DAYS_AHEAD = int(os.getenv("PARTITION_DAYS_AHEAD", "7"))
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+def default_partition_name(table: str) -> str:
+    """Catches rows outside every daily partition, e.g. while maintenance is not running"""
+    return f"{table}_default"
+
+def is_partition_name(name: str) -> bool:
+    """Whether a table name is one of the partitions managed here"""
+    for table in PARTITIONED_TABLES:
+        if name == default_partition_name(table):
+            return True
+        suffix = name[len(table) + 2:]
+        if name.startswith(f"{table}_p") and len(suffix) == 8 and suffix.isdigit():
+            return True
+    return False
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": table},
+    ).scalar()
+    return relkind == "p"
+
+def create_partition(conn: Connection, table: str, day: date):
+    """Create the partition holding one day of a table, if missing"""
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, day)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    ))
+
+def list_partitions(conn: Connection, table: str) -> Dict[date, str]:
+    """Map each daily partition of a table to its name"""
+    names = conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    ).scalars()
+    prefix = f"{table}_p"
+    partitions = {}
+    for name in names:
+        if name.startswith(prefix):
+            partitions[datetime.strptime(name[len(prefix):], "%Y%m%d").date()] = name
+    return partitions
+
+def ensure_partitions(conn: Connection, days_ahead: int = PARTITION_DAYS_AHEAD, today: Optional[date] = None):
+    """Create partitions from today through days_ahead for every partitioned table"""
+    today = today or datetime.utcnow().date()
+    for table in PARTITIONED_TABLES:
+        for offset in range(days_ahead + 1):
+            create_partition(conn, table, today + timedelta(days=offset))
+
+def drain_default_partition(conn: Connection, table: str) -> int:
+    """
+    Move rows out of a table's default partition into daily partitions;
+    returns how many. PostgreSQL will not create a partition for days the
+    default partition holds rows of, so it is detached while they move.
+    """
+    column = PARTITIONED_TABLES[table]
+    default = default_partition_name(table)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is None:
+        return 0
+    days = conn.execute(text(f"SELECT DISTINCT {column}::date FROM {default}")).scalars().all()
+    if not days:
+        return 0
+
+    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    for day in days:
+        create_partition(conn, table, day)
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} RETURNING *) INSERT INTO {table} SELECT * FROM moved"
+    )).rowcount
+    conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+    return moved
+
+def rollup_events(conn: Connection, start: datetime, end: datetime):
+    """
+    Compact raw events in [start, end) into per-device hourly rows.
+    Coalesced duplicates count as events of their own, and their highest
+    confidence is kept. Only the first event of a burst stores its own
+    confidence, so sum_confidence counts each duplicate at that confidence,
+    keeping sum_confidence / event_count an average over every occurrence.
+    Buckets are recomputed rather than incremented, so re-running a day is
+    safe.
+    """
+    conn.execute(
+        text(
+            "INSERT INTO event_rollups_hourly "
+            "(user_id, device_id, event_type, bucket, event_count, max_confidence, sum_confidence) "
+            "SELECT user_id, device_id, event_type, date_trunc('hour', timestamp), "
+            "sum(coalesce(occurrence_count, 1)), max(coalesce(max_confidence, confidence)), "
+            "sum(confidence * coalesce(occurrence_count, 1)) "
+            "FROM events WHERE timestamp >= :start AND timestamp < :end "
+            "AND user_id IS NOT NULL AND device_id IS NOT NULL AND event_type IS NOT NULL "
+            "GROUP BY user_id, device_id, event_type, date_trunc('hour', timestamp) "
+            "ON CONFLICT (user_id, device_id, event_type, bucket) DO UPDATE SET "
+            "event_count = EXCLUDED.event_count, "
+            "max_confidence = EXCLUDED.max_confidence, "
+            "sum_confidence = EXCLUDED.sum_confidence"
+        ),
+        {"start": start, "end": end},
+    )
+
+def drop_expired_partitions(conn: Connection, table: str, retention_days: int,
+                            today: Optional[date] = None) -> List[str]:
+    """Drop whole partitions older than the retention window; event partitions are rolled up first"""
+    today = today or datetime.utcnow().date()
+    cutoff = today - timedelta(days=retention_days)
+    dropped = []
+    for day, name in sorted(list_partitions(conn, table).items()):
+        if day >= cutoff:
+            continue
+        if table == "events":
+            start = datetime.combine(day, datetime.min.time())
+            rollup_events(conn, start, start + timedelta(days=1))
+        conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    return dropped
+
+def convert_to_partitioned(conn: Connection, table: str):
+    """
+    Rebuild an existing table as a daily range-partitioned table, keeping its
+    rows and id sequence. Used by the migration that introduces partitioning.
+    The primary key becomes (id, <partition column>), as PostgreSQL requires.
+    """
+    column = PARTITIONED_TABLES[table]
+    if is_partitioned(conn, table):
+        return
+
+    legacy = f"{table}_legacy"
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+    sequence = conn.execute(
+        text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": legacy}
+    ).scalar()
+
+    conn.execute(text(f"UPDATE {legacy} SET {column} = now() WHERE {column} IS NULL"))
+    conn.execute(text(
+        f"CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({column})"
+    ))
+    conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL"))
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {default_partition_name(table)} PARTITION OF {table} DEFAULT"))
+
+    # One partition per day that already holds data, plus the days ahead
+    days = conn.execute(text(f"SELECT DISTINCT {column}::date FROM {legacy}")).scalars().all()
+    for day in days:
+        create_partition(conn, table, day)
+    today = datetime.utcnow().date()
+    for offset in range(PARTITION_DAYS_AHEAD + 1):
+        create_partition(conn, table, today + timedelta(days=offset))
+
+    conn.execute(text(f"INSERT INTO {table} SELECT * FROM {legacy}"))
+    if sequence:
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+    conn.execute(text(f"DROP TABLE {legacy} CASCADE"))
+
+    conn.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+    conn.execute(text(f"ALTER TABLE {table} ADD FOREIGN KEY (user_id) REFERENCES users (id)"))
+    for name, columns in PARTITIONED_INDEXES[table].items():
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+
+def maintain(event_retention_days: int = EVENT_RETENTION_DAYS,
+             alert_retention_days: int = ALERT_RETENTION_DAYS,
+             days_ahead: int = PARTITION_DAYS_AHEAD):
+    """
+    One maintenance pass: empty the default partitions, create upcoming
+    partitions, roll up and drop expired ones
+    """
+    if engine.dialect.name != "postgresql":
+        logger.warning(f"Partition maintenance needs PostgreSQL, skipping for {engine.dialect.name}")
+        return
+
+    with engine.begin() as conn:
+        if not all(is_partitioned(conn, table) for table in PARTITIONED_TABLES):
+            logger.warning("events/alerts are not partitioned yet; run `alembic upgrade head` first")
+            return
+
+        # Rows that arrived while maintenance was behind get daily partitions, so they can expire
+        moved = sum(drain_default_partition(conn, table) for table in PARTITIONED_TABLES)
+        if moved:
+            logger.warning(f"Moved {moved} rows out of the default partitions")
+
+        ensure_partitions(conn, days_ahead)
+
+        # Keep yesterday's rollups current even before its partition expires
+        yesterday = datetime.combine(datetime.utcnow().date() - timedelta(days=1), datetime.min.time())
+        rollup_events(conn, yesterday, yesterday + timedelta(days=1))
+
+        dropped = drop_expired_partitions(conn, "events", event_retention_days)
+        dropped += drop_expired_partitions(conn, "alerts", alert_retention_days)
+    if dropped:
+        logger.info(f"Dropped expired partitions: {', '.join(dropped)}")
+
+    # Offloaded payloads outlive their events by a day at most
+    pruned = blob_store.prune((event_retention_days + 1) * 86400)
+    if pruned:
+        logger.info(f"Pruned {pruned} expired event payloads from the blob store")
+
+def main():
+    parser = argparse.ArgumentParser(description="Partition maintenance for events and alerts")
+    parser.add_argument("--event-retention-days", type=int, default=EVENT_RETENTION_DAYS)
+    parser.add_argument("--alert-retention-days", type=int, default=ALERT_RETENTION_DAYS)
+    parser.add_argument("--days-ahead", type=int, default=PARTITION_DAYS_AHEAD)
+    parser.add_argument("--interval", type=float, default=0,
+                        help="seconds between passes; 0 runs a single pass")
+    args = parser.parse_args()
+
+    configure_logging()
+    while True:
+        try:
+            maintain(args.event_retention_days, args.alert_retention_days, args.days_ahead)
+        except Exception as e:
+            logger.error(f"Partition maintenance failed: {e}")
+            if not args.interval:
+                raise
+        if not args.interval:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+from redis import Redis
+from redis.client import Pipeline
+import redis.asyncio as aioredis
+
+from .websocket_manager import broadcast_alert
+
+logger = logging.getLogger(__name__)
+
+# Redis channel that carries alerts from the workers to every web process
+ALERTS_CHANNEL = "camera_alerts"
+
+# Delay before re-subscribing after the Redis connection drops
+RECONNECT_DELAY_SECONDS = 1.0
+
+# Newest alerts kept per user so reconnecting WebSockets can catch up
+ALERT_REPLAY_SIZE = int(os.getenv("ALERT_REPLAY_SIZE", "500"))
+ALERT_REPLAY_TTL_SECONDS = int(os.getenv("ALERT_REPLAY_TTL_SECONDS", "86400"))
+
+def replay_key(user_id: int) -> str:
+    return f"alerts:recent:{user_id}"
+
+def publish_alert(redis_conn: Redis, alert_data: dict):
+    """Publish an alert so every web process can push it to its WebSockets"""
+    publish_alerts(redis_conn, [alert_data])
+
+def publish_alerts(redis_conn: Redis, alerts: List[dict], pipeline: Optional[Pipeline] = None):
+    """
+    Publish several alerts in one pipelined round-trip, and add them to their
+    owners' replay buffers (sorted sets scored by alert id, trimmed to the
+    newest ALERT_REPLAY_SIZE).
+    When a pipeline is passed the commands are only queued on it and the
+    caller executes it.
+    """
+    pipe = pipeline if pipeline is not None else redis_conn.pipeline(transaction=False)
+    replay_keys = set()
+    for alert_data in alerts:
+        message = json.dumps(alert_data)
+        pipe.publish(ALERTS_CHANNEL, message)
+        key = replay_key(alert_data["user_id"])
+        pipe.zadd(key, {message: alert_data["id"]})
+        replay_keys.add(key)
+    for key in replay_keys:
+        pipe.zremrangebyrank(key, 0, -ALERT_REPLAY_SIZE - 1)
+        pipe.expire(key, ALERT_REPLAY_TTL_SECONDS)
+    if pipeline is None:
+        pipe.execute()
+
+async def replay_alerts(redis: aioredis.Redis, user_id: int, after_id: int) -> List[Tuple[int, str]]:
+    """(id, message) of the buffered alerts of a user newer than after_id, oldest first"""
+    members = await redis.zrangebyscore(replay_key(user_id), f"({after_id}", "+inf", withscores=True)
+    return [(int(score), member.decode()) for member, score in members]
+
+async def listen_for_alerts(redis_url: str):
+    """
+    Forward alerts published on ALERTS_CHANNEL to the local WebSocket clients.
+    Each web process runs exactly one of these tasks.
+    """
+    while True:
+        client = aioredis.from_url(redis_url)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(ALERTS_CHANNEL)
+            logger.info(f"Subscribed to alert channel {ALERTS_CHANNEL}")
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                # A bad message must not drop the subscription and the alerts behind it
+                try:
+                    await broadcast_alert(message["data"].decode())
+                except Exception as e:
+                    logger.error(f"Failed to forward alert {message['data'][:200]!r}: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Alert subscriber error: {e}")
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
@@ -0,0 +1,11 @@
+from redis import Redis
+import redis.asyncio as aioredis
+import os
+
+redis_url = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+# Sync client, used by RQ and the worker
+redis_conn = Redis.from_url(redis_url)
+
+# Async client, used by request handlers in the web process
+async_redis_conn = aioredis.from_url(redis_url)
@@ -0,0 +1,35 @@
+"""
+Lean response path for the hot list endpoints.
+
+Returning ORM objects through a response_model costs an ORM instance per row,
+a pydantic validation pass and a json.dumps of the validated result. The
+endpoints here select only the columns their schema declares and serialize
+the rows with orjson. They return a Response, so FastAPI skips that work. The
+schemas in app/schemas.py stay the contract: they pick the columns, and
+response_model still documents the output.
+"""
+from typing import Dict, List, Optional, Sequence, Type
+
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Row
+
+from .schemas import EventResponse
+
+def response_columns(model, schema: Type[BaseModel]) -> List:
+    """The mapped columns of model that schema exposes, in schema order"""
+    return [getattr(model, name) for name in schema.model_fields]
+
+def rows_response(rows: Sequence[Row], headers: Optional[Dict[str, str]] = None) -> ORJSONResponse:
+    """Serialize rows selected with response_columns as a JSON array"""
+    return ORJSONResponse([row._asdict() for row in rows], headers=headers)
+
+def json_array_response(items: List[bytes], headers: Optional[Dict[str, str]] = None) -> Response:
+    """Join already encoded JSON values into an array"""
+    return Response(b"[" + b",".join(items) + b"]", media_type="application/json", headers=headers)
+
+_event_list = TypeAdapter(List[EventResponse])
+
+def events_response(events: List[EventResponse]) -> Response:
+    """Serialize already validated events in one pass, without FastAPI validating them again"""
+    return Response(_event_list.dump_json(events), media_type="application/json")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 class UserBase(BaseModel):
     email: str
@@ -14,19 +14,35 @@ class User(UserBase):
     class Config:
         from_attributes = True
 
+class CurrentUser(UserBase):
+    """The authenticated caller, as resolved from a token or device API key"""
+    id: int
+    device_id: Optional[str] = None  # set when authenticated with a device API key
+
 class EventBase(BaseModel):
     device_id: str
     event_type: str
     confidence: float
-    raw_data: Dict[str, Any]
 
 class EventCreate(EventBase):
-    pass
+    raw_data: Dict[str, Any]
+
+    @property
+    def location(self) -> Optional[str]:
+        """The location scoring and coalescing use, copied out of raw_data"""
+        location = (self.raw_data or {}).get("location")
+        return None if location is None else str(location)
 
 class EventResponse(EventBase):
+    """An event without its payload; fetch that from GET /events/{id}/raw_data"""
     id: int
     timestamp: datetime
     user_id: int
+    location: Optional[str] = None
+    raw_data_size: Optional[int] = None
+    raw_data_hash: Optional[str] = None  # set when the payload lives in the blob store
+    occurrence_count: int = 1
+    max_confidence: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -47,6 +63,46 @@ class AlertResponse(AlertBase):
     class Config:
         from_attributes = True
 
+class AlertCountBucket(BaseModel):
+    bucket: datetime
+    count: int
+
+class AlertStats(BaseModel):
+    total: int
+    by_severity: Dict[str, int]
+    by_device: Dict[str, int]
+    by_hour: List[AlertCountBucket]
+
+class QueueLaneStats(BaseModel):
+    queue: str
+    depth: int
+    oldest_wait_seconds: float
+
+class DeviceResponse(BaseModel):
+    device_id: str
+    first_seen_at: Optional[datetime] = None
+    last_seen_at: Optional[datetime] = None
+    offline_since: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class StaleDevice(BaseModel):
+    device_id: str
+    last_seen: datetime
+
+class DeviceApiKeyResponse(BaseModel):
+    id: int
+    device_id: str
+    key_prefix: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class DeviceApiKeyCreated(DeviceApiKeyResponse):
+    api_key: str  # only ever returned once, at creation
+
 class Token(BaseModel):
     access_token: str
     token_type: str
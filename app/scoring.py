@@ -0,0 +1,144 @@
+"""
+Rule-based alert scoring.
+
+Rules are read from a JSON file (ALERT_RULES_PATH, config/alert_rules.json by
+default) and compiled into a rule table: one integer column per matched field
+(event_type, device_id, location) plus a confidence threshold and a severity
+rank per rule. A batch of events is encoded into the same integer space and
+scored against every rule at once with NumPy; each event gets the highest
+severity of the rules it matches, or the default severity.
+
+A rule may set any of event_type, device_id and location; fields it leaves
+out match every event. location is the event's location column, which
+ingest copies out of raw_data.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = Path(__file__).resolve().parent.parent / "config" / "alert_rules.json"
+RULES_PATH = os.getenv("ALERT_RULES_PATH", str(DEFAULT_RULES_PATH))
+# How often workers check the rules file for changes
+RELOAD_CHECK_SECONDS = float(os.getenv("ALERT_RULES_RELOAD_SECONDS", "5"))
+
+# Rule fields that are matched against event attributes
+MATCH_FIELDS = ("event_type", "device_id", "location")
+
+# Code for a rule field that matches anything
+WILDCARD = -1
+# Code for an event value no rule mentions; never equal to a rule value
+UNKNOWN = -2
+
+# Events are scored in chunks to bound the size of the event x rule matrix
+CHUNK_SIZE = 65536
+
+class RuleEngine:
+    """A compiled set of scoring rules"""
+
+    def __init__(self, config: dict):
+        self.severities: List[str] = list(config.get("severities", ["normal", "critical"]))
+        self.default_severity: str = config.get("default_severity", self.severities[0])
+        self.default_rank = self.severities.index(self.default_severity)
+
+        rules = config.get("rules", [])
+        self.vocab: Dict[str, Dict[str, int]] = {field: {} for field in MATCH_FIELDS}
+        self.rule_codes: Dict[str, np.ndarray] = {}
+        for field in MATCH_FIELDS:
+            vocab = self.vocab[field]
+            codes = []
+            for rule in rules:
+                value = rule.get(field)
+                if value is None:
+                    codes.append(WILDCARD)
+                else:
+                    codes.append(vocab.setdefault(value, len(vocab)))
+            self.rule_codes[field] = np.asarray(codes, dtype=np.int32)
+
+        self.rule_min_confidence = np.asarray(
+            [rule.get("min_confidence", 0.0) for rule in rules], dtype=np.float64
+        )
+        self.rule_rank = np.asarray(
+            [self.severities.index(rule["severity"]) for rule in rules], dtype=np.int8
+        )
+
+    def encode(self, field: str, values: Sequence[Optional[str]]) -> np.ndarray:
+        """Map event values onto the rule table's integer codes"""
+        vocab = self.vocab[field]
+        return np.fromiter((vocab.get(value, UNKNOWN) for value in values), dtype=np.int32, count=len(values))
+
+    def score_codes(self, codes: Dict[str, np.ndarray], confidences: np.ndarray) -> np.ndarray:
+        """Return the severity rank of every encoded event"""
+        ranks = np.full(len(confidences), self.default_rank, dtype=np.int8)
+        if not len(self.rule_rank):
+            return ranks
+
+        for start in range(0, len(confidences), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            matched = confidences[start:end, None] >= self.rule_min_confidence
+            for field in MATCH_FIELDS:
+                rule_codes = self.rule_codes[field]
+                matched &= (rule_codes == WILDCARD) | (codes[field][start:end, None] == rule_codes)
+            ranks[start:end] = np.where(matched, self.rule_rank, self.default_rank).max(axis=1)
+        return ranks
+
+    def score(self, event_types: Sequence[str], device_ids: Sequence[str],
+              locations: Sequence[Optional[str]], confidences: Sequence[float]) -> List[str]:
+        """Classify a batch of events, returning one severity name per event"""
+        codes = {
+            "event_type": self.encode("event_type", event_types),
+            "device_id": self.encode("device_id", device_ids),
+            "location": self.encode("location", locations),
+        }
+        ranks = self.score_codes(codes, np.asarray(confidences, dtype=np.float64))
+        severities = np.asarray(self.severities, dtype=object)
+        return severities[ranks].tolist()
+
+    def score_events(self, events) -> List[str]:
+        """Classify a batch of Event rows"""
+        return self.score(
+            [event.event_type for event in events],
+            [event.device_id for event in events],
+            [event.location for event in events],
+            [event.confidence or 0.0 for event in events],
+        )
+
+def load_rule_engine(path: str = RULES_PATH) -> RuleEngine:
+    with open(path) as f:
+        return RuleEngine(json.load(f))
+
+_lock = threading.Lock()
+_engine: Optional[RuleEngine] = None
+_engine_mtime: Optional[float] = None
+_last_check = 0.0
+
+def get_rule_engine() -> RuleEngine:
+    """
+    Return the current rule engine, reloading the rules file if it changed.
+    A file that fails to parse is logged and the previous rules stay active.
+    """
+    global _engine, _engine_mtime, _last_check
+    now = time.monotonic()
+    if _engine is not None and now - _last_check < RELOAD_CHECK_SECONDS:
+        return _engine
+
+    with _lock:
+        _last_check = now
+        try:
+            mtime = os.path.getmtime(RULES_PATH)
+            if _engine is None or mtime != _engine_mtime:
+                _engine = load_rule_engine(RULES_PATH)
+                _engine_mtime = mtime
+                logger.info(f"Loaded {len(_engine.rule_rank)} alert rules from {RULES_PATH}")
+        except Exception as e:
+            if _engine is None:
+                raise
+            logger.error(f"Failed to reload alert rules from {RULES_PATH}, keeping previous rules: {e}")
+        return _engine
@@ -1,60 +1,207 @@
 from rq import Queue
-from sqlalchemy.orm import Session
+from rq.job import Job
+from rq.utils import str_to_date
+from sqlalchemy import insert, select
 from datetime import datetime
-import random
-import json
-import asyncio
-from redis import Redis
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
 
 from .database import SessionLocal
+from .metrics import (
+    ENQUEUE_SECONDS, EVENT_TO_ALERT_SECONDS, EVENTS_ENQUEUED, EVENTS_PROCESSED, PROCESS_SECONDS
+)
+from .alert_cache import cache_alerts
+from .alert_stats import record_alert_stats
 from .models import Event, Alert
-from .websocket_manager import broadcast_alert
+from .pubsub import publish_alerts
+from .redis_client import redis_conn
+from .scoring import get_rule_engine
 
-# Initialize RQ queue with Redis connection
-redis_url = "redis://redis:6379/0"
-redis_conn = Redis.from_url(redis_url)
-queue = Queue("camera_tasks", connection=redis_conn)
+logger = logging.getLogger(__name__)
 
-def process_event(event_id: int):
+# Processing lanes, most urgent first. Each lane is its own RQ queue, so a
+# flood of routine events cannot delay critical ones, and workers can be
+# dedicated to a lane (python -m app.worker --lanes critical).
+LANES: Dict[str, Queue] = {
+    "critical": Queue("camera_tasks_critical", connection=redis_conn),
+    "default": Queue("camera_tasks", connection=redis_conn),
+    "bulk": Queue("camera_tasks_bulk", connection=redis_conn),
+}
+queue = LANES["default"]
+
+# Routine events below this confidence go to the bulk lane
+BULK_MAX_CONFIDENCE = float(os.getenv("QUEUE_BULK_MAX_CONFIDENCE", "0.5"))
+
+def classify_events(events) -> List[Tuple[Optional[str], str]]:
     """
-    Process an event and create an alert based on the event data.
-    This is a simulated AI processing function.
+    The (severity, lane) of each event (anything with event_type, device_id,
+    location and confidence). Events the alert rules would rate at the top
+    severity go to the critical lane; default-severity events below
+    BULK_MAX_CONFIDENCE go to the bulk lane. The severity is None when the
+    rules cannot be loaded.
     """
+    try:
+        engine = get_rule_engine()
+        severities = engine.score_events(events)
+    except Exception as e:
+        logger.error(f"Event routing unavailable, using the default lane: {e}")
+        return [(None, "default")] * len(events)
+
+    classes = []
+    for event, severity in zip(events, severities):
+        if severity == engine.severities[-1]:
+            lane = "critical"
+        elif severity == engine.default_severity and (event.confidence or 0.0) < BULK_MAX_CONFIDENCE:
+            lane = "bulk"
+        else:
+            lane = "default"
+        classes.append((severity, lane))
+    return classes
+
+def route_events(events) -> List[str]:
+    """Pick a lane for each event, see classify_events"""
+    return [lane for _, lane in classify_events(events)]
+
+def enqueue_event_jobs(events, lanes: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Queue a process_event job per event on its lane, in one pipelined call;
+    returns jobs per lane. Events are routed unless their lanes are given.
+    """
+    event_ids: Dict[str, List[int]] = {}
+    for event, lane in zip(events, lanes if lanes is not None else route_events(events)):
+        event_ids.setdefault(lane, []).append(event.id)
+
+    with ENQUEUE_SECONDS.time():
+        pipe = redis_conn.pipeline()
+        for lane, ids in event_ids.items():
+            LANES[lane].enqueue_many(
+                [Queue.prepare_data(process_event, (event_id,)) for event_id in ids], pipeline=pipe
+            )
+        pipe.execute()
+    for lane, ids in event_ids.items():
+        EVENTS_ENQUEUED.labels(lane).inc(len(ids))
+    return {lane: len(ids) for lane, ids in event_ids.items()}
+
+def lane_stats() -> Dict[str, dict]:
+    """Depth of every lane and how long its oldest job has been waiting"""
+    pipe = redis_conn.pipeline()
+    for lane_queue in LANES.values():
+        pipe.llen(lane_queue.key)
+        pipe.lindex(lane_queue.key, 0)
+    results = pipe.execute()
+
+    heads = results[1::2]
+    for job_id in heads:
+        if job_id is not None:
+            pipe.hget(Job.key_for(job_id.decode()), "enqueued_at")
+    enqueued = iter(pipe.execute())
+
+    now = datetime.utcnow()
+    stats = {}
+    for (lane, lane_queue), depth, job_id in zip(LANES.items(), results[::2], heads):
+        oldest_wait = 0.0
+        if job_id is not None:
+            enqueued_at = str_to_date(next(enqueued))
+            if enqueued_at is not None:
+                oldest_wait = max((now - enqueued_at).total_seconds(), 0.0)
+        stats[lane] = {"queue": lane_queue.name, "depth": depth, "oldest_wait_seconds": oldest_wait}
+    return stats
+
+def process_events(event_ids: List[int]) -> List[dict]:
+    """
+    Process a batch of events and create one alert per event.
+    Events are loaded with a single IN query, alerts are bulk-inserted and
+    committed once, and all resulting alerts are published together.
+    Events that already have an alert are skipped, so a batch can be retried
+    safely. Once the alerts are committed, a failed publish is only logged.
+    Severity comes from the rule engine in app/scoring.py; per-user alert
+    counters (app/alert_stats.py) and the recent alerts cache
+    (app/alert_cache.py) are updated alongside the publish.
+    """
+    with PROCESS_SECONDS.time():
+        return _process_events(event_ids)
+
+def _process_events(event_ids: List[int]) -> List[dict]:
     db = SessionLocal()
     try:
-        # Get the event
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            return
-
-        # Simulate AI processing
-        # In a real application, this would involve actual image/video processing
-        is_critical = random.random() < 0.3  # 30% chance of being critical
-        severity = "critical" if is_critical else "normal"
-        
-        # Create alert
-        alert = Alert(
-            event_id=event.id,
-            severity=severity,
-            description=f"Processed {event.event_type} event from device {event.device_id}",
-            user_id=event.user_id
-        )
-        
-        db.add(alert)
+        # Get the events
+        events = db.query(Event).filter(Event.id.in_(event_ids)).all()
+        if events:
+            # Alerts are created after their event, which lets the partitioned table skip older days
+            done = set(db.scalars(
+                select(Alert.event_id).where(
+                    Alert.event_id.in_([event.id for event in events]),
+                    Alert.created_at >= min(event.timestamp for event in events),
+                )
+            ))
+            events = [event for event in events if event.id not in done]
+        if not events:
+            return []
+
+        # Score the whole batch in one pass
+        severities = get_rule_engine().score_events(events)
+
+        now = datetime.utcnow()
+        rows = [
+            {
+                "event_id": event.id,
+                "severity": severity,
+                "description": f"Processed {event.event_type} event from device {event.device_id}",
+                "created_at": now,
+                "user_id": event.user_id,
+            }
+            for event, severity in zip(events, severities)
+        ]
+
+        # Create alerts
+        alerts = db.scalars(insert(Alert).values(rows).returning(Alert)).all()
+
+        # Prepare alert data for WebSocket broadcast; ingested_at lets the web
+        # process measure ingest-to-delivery latency
+        ingested_at = {event.id: event.timestamp for event in events}
+        alert_data = [
+            {
+                "id": alert.id,
+                "event_id": alert.event_id,
+                "severity": alert.severity,
+                "description": alert.description,
+                "created_at": alert.created_at.isoformat(),
+                "ingested_at": ingested_at[alert.event_id].isoformat(),
+                "user_id": alert.user_id
+            }
+            for alert in alerts
+        ]
         db.commit()
-        
-        # Prepare alert data for WebSocket broadcast
-        alert_data = {
-            "id": alert.id,
-            "event_id": alert.event_id,
-            "severity": alert.severity,
-            "description": alert.description,
-            "created_at": alert.created_at.isoformat(),
-            "user_id": alert.user_id
-        }
-        
-        # Broadcast alert to WebSocket clients
-        asyncio.run(broadcast_alert(json.dumps(alert_data)))
+
+        EVENTS_PROCESSED.inc(len(alerts))
+        for alert in alerts:
+            EVENT_TO_ALERT_SECONDS.labels(alert.severity).observe(
+                (alert.created_at - ingested_at[alert.event_id]).total_seconds()
+            )
+
+        # Publish alerts so the web processes can push them to WebSocket clients,
+        # and bump the /alerts/stats counters and the /alerts/ cache in the same round-trip
+        device_ids = {event.id: event.device_id for event in events}
+        pipe = redis_conn.pipeline(transaction=False)
+        publish_alerts(redis_conn, alert_data, pipeline=pipe)
+        record_alert_stats(pipe, [
+            (alert.user_id, alert.severity, device_ids[alert.event_id], alert.created_at)
+            for alert in alerts
+        ])
+        cache_alerts(pipe, alert_data)
+        try:
+            pipe.execute()
+        except Exception as e:
+            # The alerts are committed; retrying the batch would only skip them
+            logger.error(f"Failed to publish {len(alert_data)} alerts: {e}")
+        return alert_data
 
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def process_event(event_id: int):
+    """
+    Process an event and create an alert based on the event data.
+    """
+    process_events([event_id])
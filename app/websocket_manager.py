@@ -1,13 +1,191 @@
 from fastapi import WebSocket
-from typing import List
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import json
+import logging
+import os
 
-# Store active WebSocket connections
-active_connections: List[WebSocket] = []
+import msgpack
 
-async def broadcast_alert(alert_data: str):
-    """Broadcast alert to all connected WebSocket clients"""
-    for connection in active_connections:
+from .metrics import INGEST_TO_DELIVERY_SECONDS, WS_CONNECTIONS, WS_SEND_SECONDS, seconds_since
+
+logger = logging.getLogger(__name__)
+
+# Outgoing messages buffered per socket before the client counts as too slow
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+# Longest a single send may take before the client is dropped
+SEND_TIMEOUT_SECONDS = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+
+# Close code used when a client is dropped for falling behind (1013 = try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+# Alert encodings a client can ask for with ?format=
+ALERT_FORMATS = ("json", "msgpack")
+# Longest a client may ask for alerts to be held back and sent as one frame
+MAX_BATCH_MS = int(os.getenv("WS_MAX_BATCH_MS", "1000"))
+
+# Loads the (alert id, message) pairs a reconnecting client missed
+ReplaySource = Callable[[], Awaitable[List[Tuple[int, str]]]]
+# A serialized alert, with its decoded form when the broadcaster already has it
+Message = Tuple[str, Optional[dict]]
+# (alert id, serialized alert, decoded alert, event ingest time) waiting to be sent
+QueuedAlert = Tuple[Optional[int], str, Optional[dict], Optional[str]]
+
+class ClientConnection:
+    """
+    A WebSocket together with its bounded outgoing queue and writer task.
+    Alerts are sent as one JSON text frame each by default. A msgpack client
+    gets binary frames instead, and with a batch interval every frame holds
+    an array of all alerts queued during that interval.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: int, max_queue_size: int,
+                 format: str = "json", batch_interval: float = 0.0):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.format = format
+        self.batch_interval = batch_interval
+
+    def encode(self, messages: List[Message]):
+        """Encode alerts as a frame: a single alert, or an array when batching"""
+        if self.format == "msgpack":
+            # Broadcast alerts come decoded; only replayed ones are decoded here
+            alerts = [alert if alert is not None else json.loads(text) for text, alert in messages]
+            return msgpack.packb(alerts if self.batch_interval else alerts[0])
+        if self.batch_interval:
+            return "[" + ",".join(text for text, _ in messages) + "]"
+        return messages[0][0]
+
+class ConnectionManager:
+    """
+    Registry of open alert sockets, indexed by user id.
+    Broadcasting only touches the sockets of the alert's owner and never
+    awaits a peer: messages go onto each socket's queue and a per-socket
+    writer task sends them. Clients whose queue fills up are closed.
+    """
+
+    def __init__(self, max_queue_size: int = SEND_QUEUE_SIZE, send_timeout: float = SEND_TIMEOUT_SECONDS):
+        self.max_queue_size = max_queue_size
+        self.send_timeout = send_timeout
+        self.connections: Dict[int, Set[ClientConnection]] = {}
+        # Closes of dropped clients still running, referenced so they are not garbage collected
+        self._close_tasks: Set[asyncio.Task] = set()
+
+    def connect(self, websocket: WebSocket, user_id: int, replay: Optional[ReplaySource] = None,
+                format: str = "json", batch_ms: int = 0) -> ClientConnection:
+        """
+        Register an accepted WebSocket and start its writer task.
+        With a replay source, the writer first sends the missed alerts it
+        returns. The socket is registered before they are loaded, so alerts
+        broadcast meanwhile are queued too and sent once, after the replay.
+        """
+        connection = ClientConnection(
+            websocket, user_id, self.max_queue_size, format, min(max(batch_ms, 0), MAX_BATCH_MS) / 1000
+        )
+        self.connections.setdefault(user_id, set()).add(connection)
+        connection.writer_task = asyncio.create_task(self._writer(connection, replay))
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        """Unregister a connection and stop its writer; safe to call twice"""
+        sockets = self.connections.get(connection.user_id)
+        if sockets is not None:
+            sockets.discard(connection)
+            if not sockets:
+                del self.connections[connection.user_id]
+        if connection.writer_task and connection.writer_task is not asyncio.current_task():
+            connection.writer_task.cancel()
+
+    def broadcast(self, user_id: int, message: str, alert_id: Optional[int] = None,
+                  ingested_at: Optional[str] = None, alert: Optional[dict] = None) -> int:
+        """
+        Queue a message for every socket of a user; returns how many accepted it.
+        Pass the decoded message as alert to spare msgpack clients decoding it again.
+        """
+        delivered = 0
+        for connection in list(self.connections.get(user_id, ())):
+            try:
+                connection.queue.put_nowait((alert_id, message, alert, ingested_at))
+                delivered += 1
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping slow WebSocket client for user {user_id}")
+                self.disconnect(connection)
+                task = asyncio.create_task(self._close(connection, SLOW_CLIENT_CLOSE_CODE, "Client too slow"))
+                self._close_tasks.add(task)
+                task.add_done_callback(self._close_tasks.discard)
+        return delivered
+
+    def count(self) -> int:
+        return sum(len(sockets) for sockets in self.connections.values())
+
+    async def _writer(self, connection: ClientConnection, replay: Optional[ReplaySource] = None):
         try:
-            await connection.send_text(alert_data)
+            replayed: Set[int] = set()
+            if replay is not None:
+                try:
+                    missed = await replay()
+                except Exception as e:
+                    logger.error(f"Failed to load alerts to replay for user {connection.user_id}: {e}")
+                    missed = []
+                if missed:
+                    await self._send(connection, [(message, None) for _, message in missed])
+                    replayed.update(alert_id for alert_id, _ in missed)
+                    logger.info(f"Replayed {len(missed)} missed alerts to user {connection.user_id}")
+            while True:
+                batch = await self._next_batch(connection, replayed)
+                if batch:
+                    await self._send(connection, [(message, alert) for _, message, alert, _ in batch])
+                    for *_, ingested_at in batch:
+                        latency = seconds_since(ingested_at)
+                        if latency is not None:
+                            INGEST_TO_DELIVERY_SECONDS.observe(latency)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print(f"Error sending alert to WebSocket client: {e}") 
\ No newline at end of file
+            logger.warning(f"Error sending alert to WebSocket client: {e}")
+            self.disconnect(connection)
+            await self._close(connection, SLOW_CLIENT_CLOSE_CODE, "Send failed")
+
+    async def _next_batch(self, connection: ClientConnection, replayed: Set[int]) -> List[QueuedAlert]:
+        """Wait for the next alert, then for a batching client gather the rest of its interval"""
+        batch = [await connection.queue.get()]
+        if connection.batch_interval:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + connection.batch_interval
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(connection.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        return [item for item in batch if item[0] is None or item[0] not in replayed]
+
+    async def _send(self, connection: ClientConnection, messages: List[Message]):
+        frames = [messages] if connection.batch_interval else [[message] for message in messages]
+        for frame in frames:
+            data = connection.encode(frame)
+            if isinstance(data, bytes):
+                send = connection.websocket.send_bytes(data)
+            else:
+                send = connection.websocket.send_text(data)
+            with WS_SEND_SECONDS.time():
+                await asyncio.wait_for(send, self.send_timeout)
+
+    async def _close(self, connection: ClientConnection, code: int, reason: str):
+        try:
+            await connection.websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+# Store active WebSocket connections
+manager = ConnectionManager()
+WS_CONNECTIONS.set_function(manager.count)
+
+async def broadcast_alert(alert_data: str):
+    """Push a serialized alert to the WebSocket clients of the user that owns it"""
+    alert = json.loads(alert_data)
+    manager.broadcast(alert.get("user_id"), alert_data, alert.get("id"), alert.get("ingested_at"), alert)
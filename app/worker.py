@@ -0,0 +1,269 @@
+"""
+Long-lived batch worker for the event processing lanes.
+
+Instead of running one RQ job per event, this worker pops queued jobs in
+micro-batches (up to --batch-size jobs, or whatever arrived within
+--max-wait-ms of the first one) and hands all their event ids to
+process_events in a single call. Run it in place of `rq worker`:
+
+    python -m app.worker --batch-size 500 --max-wait-ms 50
+
+It serves the lanes in app.tasks.LANES in priority order: every batch comes
+from the most urgent lane that has work. --lanes restricts a worker to some
+lanes, e.g. to dedicate capacity to critical events:
+
+    python -m app.worker --lanes critical
+
+Jobs are claimed atomically: the same Lua call that pops them from their
+queue adds them to the queue's RQ StartedJobRegistry, due after
+WORKER_JOB_LEASE_SECONDS. Finished and failed jobs leave the registry with
+their batch. If a worker dies mid-batch, the next worker to find the lease
+expired puts those jobs back on their queue. process_events skips events
+that already have an alert, so a batch that was committed before the crash
+does not create duplicates.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import start_http_server
+from redis import Redis
+from rq import Queue
+from rq.job import Job
+
+from .logging_config import configure_logging
+from .metrics import QUEUE_WAIT_SECONDS, WORKER_METRICS_PORT
+from .tasks import LANES, redis_conn, process_event, process_events
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", "500"))
+MAX_WAIT_MS = int(os.getenv("WORKER_MAX_WAIT_MS", "50"))
+REPORT_INTERVAL_SECONDS = float(os.getenv("WORKER_REPORT_INTERVAL_SECONDS", "10"))
+# A claimed job not finished within this is handed to another worker
+JOB_LEASE_SECONDS = int(os.getenv("WORKER_JOB_LEASE_SECONDS", "300"))
+# How often an idle worker, or one filling a batch, checks the queues again
+POLL_INTERVAL_MS = int(os.getenv("WORKER_POLL_INTERVAL_MS", "5"))
+
+# KEYS: queues, most urgent first, then their started registries in the same
+# order. Pops up to ARGV[1] job ids from the first non-empty queue and adds
+# them to its registry due at ARGV[2]. Returns {queue index, ids...} or nil.
+CLAIM_JOBS_SCRIPT = """
+local lanes = #KEYS / 2
+for i = 1, lanes do
+    local ids = redis.call('LPOP', KEYS[i], ARGV[1])
+    if ids then
+        for _, id in ipairs(ids) do
+            redis.call('ZADD', KEYS[lanes + i], ARGV[2], id)
+        end
+        table.insert(ids, 1, i)
+        return ids
+    end
+end
+return nil
+"""
+
+# KEYS: queues and their started registries as above. Moves job ids whose
+# lease ended before ARGV[1] back to their queue; returns how many.
+REQUEUE_EXPIRED_SCRIPT = """
+local lanes = #KEYS / 2
+local requeued = 0
+for i = 1, lanes do
+    local ids = redis.call('ZRANGEBYSCORE', KEYS[lanes + i], 0, ARGV[1])
+    for _, id in ipairs(ids) do
+        redis.call('ZREM', KEYS[lanes + i], id)
+        redis.call('RPUSH', KEYS[i], id)
+    end
+    requeued = requeued + #ids
+end
+return requeued
+"""
+
+PROCESS_EVENT_FUNC = f"{process_event.__module__}.{process_event.__name__}"
+
+class LaneStats:
+    """Counters for one lane over a report interval"""
+
+    def __init__(self):
+        self.events = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+class BatchStats:
+    """Per-lane throughput, batch-size and queue wait counters, logged every report interval"""
+
+    def __init__(self, report_interval: float):
+        self.report_interval = report_interval
+        self.reset()
+
+    def reset(self):
+        self.started = time.monotonic()
+        self.lanes: Dict[str, LaneStats] = {}
+
+    def record(self, lane: str, batch_size: int, failed: int = 0, waits: Optional[List[float]] = None):
+        stats = self.lanes.setdefault(lane, LaneStats())
+        stats.events += batch_size
+        stats.batches += 1
+        stats.max_batch = max(stats.max_batch, batch_size)
+        stats.failed += failed
+        if waits:
+            stats.total_wait += sum(waits)
+            stats.max_wait = max(stats.max_wait, max(waits))
+
+    def maybe_report(self):
+        """Log and reset the counters once per report interval; returns whether it did"""
+        elapsed = time.monotonic() - self.started
+        if elapsed < self.report_interval:
+            return False
+        for lane, stats in self.lanes.items():
+            logger.info(
+                f"[{lane}] Processed {stats.events} events in {stats.batches} batches "
+                f"({stats.events / elapsed:.1f} events/sec, "
+                f"avg batch {stats.events / stats.batches:.1f}, max batch {stats.max_batch}, "
+                f"queue wait avg {stats.total_wait / stats.events * 1000:.0f} ms "
+                f"max {stats.max_wait * 1000:.0f} ms, failed {stats.failed})"
+            )
+        self.reset()
+        return True
+
+class BatchWorker:
+    def __init__(self, queues: List[Queue], connection: Redis, batch_size: int = BATCH_SIZE,
+                 max_wait_ms: int = MAX_WAIT_MS, report_interval: float = REPORT_INTERVAL_SECONDS):
+        self.queues = queues  # most urgent first
+        self.queues_by_key = {queue.key: queue for queue in queues}
+        self.connection = connection
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.poll_interval = POLL_INTERVAL_MS / 1000
+        self.stats = BatchStats(report_interval)
+        self._claim_jobs = connection.register_script(CLAIM_JOBS_SCRIPT)
+        self._requeue_expired = connection.register_script(REQUEUE_EXPIRED_SCRIPT)
+
+    def claim(self, queues: List[Queue], count: int) -> Tuple[Optional[Queue], List[str]]:
+        """Pop up to count job ids from the first non-empty queue, registering them as started"""
+        keys = [queue.key for queue in queues] + [queue.started_job_registry.key for queue in queues]
+        claimed = self._claim_jobs(keys=keys, args=[count, time.time() + JOB_LEASE_SECONDS])
+        if not claimed:
+            return None, []
+        return queues[claimed[0] - 1], [job_id.decode() for job_id in claimed[1:]]
+
+    def requeue_expired(self) -> int:
+        """Put jobs back whose worker did not finish them within the lease"""
+        keys = [queue.key for queue in self.queues] + [queue.started_job_registry.key for queue in self.queues]
+        requeued = self._requeue_expired(keys=keys, args=[time.time()])
+        if requeued:
+            logger.warning(f"Requeued {requeued} jobs abandoned by a worker")
+        return requeued
+
+    def fetch_batch(self) -> Tuple[Optional[Queue], List[Job]]:
+        """
+        Claim up to batch_size jobs from the most urgent non-empty queue,
+        waiting at most max_wait after the first
+        """
+        queue, job_ids = self.claim(self.queues, self.batch_size)
+        if queue is None:
+            time.sleep(self.poll_interval)
+            return None, []
+
+        deadline = time.monotonic() + self.max_wait
+        while len(job_ids) < self.batch_size:
+            _, more = self.claim([queue], self.batch_size - len(job_ids))
+            if more:
+                job_ids.extend(more)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+
+        jobs = Job.fetch_many(job_ids, connection=self.connection)
+        missing = [job_id for job_id, job in zip(job_ids, jobs) if job is None]
+        if missing:
+            self.connection.zrem(queue.started_job_registry.key, *missing)
+        return queue, [job for job in jobs if job is not None]
+
+    def process_batch(self, queue: Queue, jobs: List[Job]) -> int:
+        """Run a batch of jobs; returns the number of jobs that failed"""
+        event_jobs = [job for job in jobs if job.func_name == PROCESS_EVENT_FUNC]
+        other_jobs = [job for job in jobs if job.func_name != PROCESS_EVENT_FUNC]
+
+        done, failed = [], []
+        if event_jobs:
+            try:
+                process_events([job.args[0] for job in event_jobs])
+                done.extend(event_jobs)
+            except Exception as e:
+                logger.error(f"Batch of {len(event_jobs)} events failed, retrying one by one: {e}")
+                other_jobs = event_jobs + other_jobs
+
+        # Anything that is not a plain process_event job, or that belongs to a
+        # failed batch, runs on its own so one bad event cannot sink the rest
+        for job in other_jobs:
+            try:
+                job.func(*job.args, **job.kwargs)
+                done.append(job)
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                failed.append((job, e))
+
+        pipe = self.connection.pipeline()
+        pipe.zrem(queue.started_job_registry.key, *[job.id for job in jobs])
+        for job in done:
+            job.delete(pipeline=pipe, remove_from_queue=False)
+        for job, e in failed:
+            queue.failed_job_registry.add(job, exc_string=str(e), pipeline=pipe)
+        pipe.execute()
+        return len(failed)
+
+    def work(self):
+        logger.info(
+            f"Batch worker listening on {', '.join(queue.name for queue in self.queues)} "
+            f"(batch size {self.batch_size}, max wait {self.max_wait * 1000:.0f} ms)"
+        )
+        lanes = {queue.name: lane for lane, queue in LANES.items()}
+        self.requeue_expired()
+        while True:
+            queue, jobs = self.fetch_batch()
+            if jobs:
+                now = datetime.utcnow()
+                waits = [(now - job.enqueued_at).total_seconds() for job in jobs if job.enqueued_at]
+                lane = lanes.get(queue.name, queue.name)
+                for wait in waits:
+                    QUEUE_WAIT_SECONDS.labels(lane).observe(wait)
+                failed = self.process_batch(queue, jobs)
+                self.stats.record(lane, len(jobs), failed, waits)
+            if self.stats.maybe_report():
+                self.requeue_expired()
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch worker for camera events")
+    parser.add_argument("--lanes", default=os.getenv("WORKER_LANES", ",".join(LANES)),
+                        help=f"comma-separated lanes to serve, most urgent first (from {', '.join(LANES)})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="max events per batch")
+    parser.add_argument("--max-wait-ms", type=int, default=MAX_WAIT_MS, help="max time to fill a batch")
+    parser.add_argument("--report-interval", type=float, default=REPORT_INTERVAL_SECONDS,
+                        help="seconds between throughput reports")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT,
+                        help="port serving Prometheus metrics; 0 disables")
+    args = parser.parse_args()
+
+    lanes = [lane.strip() for lane in args.lanes.split(",") if lane.strip()]
+    unknown = [lane for lane in lanes if lane not in LANES]
+    if unknown or not lanes:
+        parser.error(f"unknown lanes: {', '.join(unknown) or '(none given)'}")
+
+    configure_logging()
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+        logger.info(f"Serving metrics on port {args.metrics_port}")
+    BatchWorker([LANES[lane] for lane in lanes], redis_conn, args.batch_size, args.max_wait_ms,
+                args.report_interval).work()
+
+if __name__ == "__main__":
+    main()
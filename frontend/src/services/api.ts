@@ -51,7 +51,10 @@ export interface Event {
   event_type: string;
   confidence: number;
   timestamp: string;
-  raw_data: any;
+  raw_data?: any; // sent on create; fetch with GET /events/{id}/raw_data
+  location?: string | null;
+  raw_data_size?: number | null;
+  raw_data_hash?: string | null;
   user_id: number;
 }
 
@@ -61,6 +64,7 @@ export interface Alert {
   severity: "critical" | "normal";
   description: string;
   created_at: string;
+  ingested_at?: string; // when the alert's event was received (WebSocket only)
   user_id: number;
 }
 
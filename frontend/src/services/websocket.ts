@@ -6,13 +6,18 @@ class WebSocketService {
   private maxReconnectAttempts = 5;
   private reconnectTimeout = 1000;
   private alertCallbacks: ((alert: Alert) => void)[] = [];
+  // Newest alert received, so a reconnect only replays what was missed
+  private lastAlertId: number | null = null;
 
   connect(token: string) {
     if (this.ws) {
       this.ws.close();
     }
 
-    const wsUrl = `ws://localhost:7001/ws/alerts?token=${token}`;
+    let wsUrl = `ws://localhost:7001/ws/alerts?token=${token}`;
+    if (this.lastAlertId !== null) {
+      wsUrl += `&last_alert_id=${this.lastAlertId}`;
+    }
     console.log("Connecting to WebSocket:", wsUrl);
     this.ws = new WebSocket(wsUrl);
 
@@ -25,6 +30,9 @@ class WebSocketService {
       try {
         console.log("Received WebSocket message:", event.data);
         const alert = JSON.parse(event.data) as Alert;
+        if (this.lastAlertId === null || alert.id > this.lastAlertId) {
+          this.lastAlertId = alert.id;
+        }
         this.alertCallbacks.forEach((callback) => callback(alert));
       } catch (error) {
         console.error("Error parsing WebSocket message:", error);
@@ -69,6 +77,7 @@ class WebSocketService {
       this.ws = null;
     }
     this.alertCallbacks = [];
+    this.lastAlertId = null;
   }
 }
 
@@ -0,0 +1,75 @@
+"""
+Rebuild the Redis counters behind GET /alerts/stats from the alerts table.
+
+Workers keep the counters current as alerts are created; run this once when
+the counters are introduced, or after Redis lost its data:
+
+    python scripts/backfill_alert_stats.py
+
+Existing counters are replaced. Alerts created while the script runs may be
+counted twice, so stop the workers first for exact numbers.
+"""
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+from sqlalchemy import func, select
+
+from app.alert_stats import (
+    ALERT_STATS_HOURLY_RETENTION_DAYS, device_key, hourly_key, severity_key
+)
+from app.database import SessionLocal
+from app.models import Alert, Event
+from app.redis_client import redis_conn
+
+def backfill():
+    db = SessionLocal()
+    try:
+        by_severity = db.execute(
+            select(Alert.user_id, Alert.severity, func.count())
+            .group_by(Alert.user_id, Alert.severity)
+        ).all()
+        by_device = db.execute(
+            select(Alert.user_id, Event.device_id, func.count())
+            .join(Event, Alert.event_id == Event.id)
+            .where(Event.device_id.is_not(None))
+            .group_by(Alert.user_id, Event.device_id)
+        ).all()
+        since = (datetime.utcnow() - timedelta(days=ALERT_STATS_HOURLY_RETENTION_DAYS)).replace(
+            minute=0, second=0, microsecond=0
+        )
+        hour = func.date_trunc("hour", Alert.created_at)
+        by_hour = db.execute(
+            select(Alert.user_id, hour, func.count())
+            .where(Alert.created_at >= since)
+            .group_by(Alert.user_id, hour)
+        ).all()
+    finally:
+        db.close()
+
+    user_ids = {row[0] for row in by_severity}
+    pipe = redis_conn.pipeline(transaction=True)
+    for user_id in user_ids:
+        pipe.delete(severity_key(user_id), device_key(user_id))
+        for day in range(ALERT_STATS_HOURLY_RETENTION_DAYS + 1):
+            pipe.delete(hourly_key(user_id, since + timedelta(days=day)))
+    for user_id, severity, count in by_severity:
+        pipe.hset(severity_key(user_id), severity, count)
+    for user_id, device_id, count in by_device:
+        pipe.hset(device_key(user_id), device_id, count)
+    hourly_keys = set()
+    for user_id, bucket, count in by_hour:
+        key = hourly_key(user_id, bucket)
+        pipe.hset(key, f"{bucket:%H}", count)
+        hourly_keys.add(key)
+    for key in hourly_keys:
+        pipe.expire(key, ALERT_STATS_HOURLY_RETENTION_DAYS * 86400)
+    pipe.execute()
+    print(f"Rebuilt alert statistics for {len(user_ids)} users")
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,101 @@
+"""
+Micro-benchmark for the GET /alerts/ response path.
+
+Compares CPU time per request of the old ORM + response_model path with the
+lean one (selected columns serialized with orjson, see app/responses.py),
+on an in-memory SQLite database, for pages of 100 and 1000 alerts:
+
+    python scripts/bench_serialization.py --sizes 100,1000 --requests 200
+
+Both paths are checked to produce the same JSON first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+# The app's own engines are never used; don't let them point at Postgres
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Alert
+from app.responses import response_columns, rows_response
+from app.schemas import AlertResponse
+
+def make_database(count: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1, 12, 0, 0, 123456)
+    with engine.begin() as conn:
+        conn.execute(Alert.__table__.insert(), [
+            {
+                "event_id": i + 1,
+                "severity": "critical" if i % 10 == 0 else "normal",
+                "description": f"person_detected on camera_{i % 1000:03d} at zone_{i % 5 + 1}",
+                "created_at": start + timedelta(seconds=i),
+                "user_id": 1,
+            }
+            for i in range(count)
+        ])
+    return sessionmaker(bind=engine)
+
+async def orm_path(db, limit: int, field) -> bytes:
+    """The old path: Alert instances validated and dumped by FastAPI's response_model"""
+    alerts = db.scalars(select(Alert).where(Alert.user_id == 1).order_by(Alert.created_at.desc()).limit(limit)).all()
+    content = await serialize_response(field=field, response_content=alerts)
+    db.expunge_all()
+    return JSONResponse(content).body
+
+def lean_path(db, limit: int, columns) -> bytes:
+    rows = db.execute(select(*columns).where(Alert.user_id == 1).order_by(Alert.created_at.desc()).limit(limit)).all()
+    return rows_response(rows).body
+
+async def bench(size: int, requests: int):
+    Session = make_database(size)
+    field = create_response_field(name="response", type_=list[AlertResponse])
+    columns = response_columns(Alert, AlertResponse)
+
+    with Session() as db:
+        if json.loads(await orm_path(db, size, field)) != json.loads(lean_path(db, size, columns)):
+            raise SystemExit(f"Lean path output differs from response_model output for {size} alerts")
+
+        results = {}
+        for name in ("orm", "lean"):
+            start = time.process_time()
+            for _ in range(requests):
+                if name == "orm":
+                    await orm_path(db, size, field)
+                else:
+                    lean_path(db, size, columns)
+            results[name] = (time.process_time() - start) / requests * 1000
+
+    print(
+        f"{size:>5} alerts: response_model {results['orm']:.2f} ms, "
+        f"lean {results['lean']:.2f} ms CPU per request ({results['orm'] / results['lean']:.1f}x)"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="GET /alerts/ serialization micro-benchmark")
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated page sizes")
+    parser.add_argument("--requests", type=int, default=200, help="requests timed per size and path")
+    args = parser.parse_args()
+
+    for size in [int(size) for size in args.sizes.split(",")]:
+        asyncio.run(bench(size, args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Load test and benchmark harness for the ingest-to-alert pipeline.
+
+Simulates many cameras with asyncio, each sending events at a fixed rate
+over HTTP (POST /events/) or through gateway sockets (/ws/events), while N
+dashboards listen on /ws/alerts. Reports ingest throughput, ingest latency
+and alert delivery latency (camera send to dashboard receive) percentiles,
+and can write them as JSON to compare runs between commits:
+
+    # against a running stack
+    python scripts/load_test.py --cameras 1000 --rate 1 --websockets 50 --duration 30
+
+    # self-contained: app and batch worker in-process on SQLite + fakeredis
+    python scripts/load_test.py --local --cameras 200 --output results.json
+
+    # compare with a previous run
+    python scripts/load_test.py --local --cameras 200 --compare results.json
+
+--local also accepts --database-url (e.g. a local Postgres) and --redis-url
+(a local Redis) instead of SQLite and fakeredis. The SQLite database needs
+aiosqlite, and fakeredis needs lupa for the Lua scripts; all three are in
+requirements-dev.txt.
+
+Latencies are measured from when an event was due, not when it was sent,
+so a server that falls behind shows up as latency rather than as a lower
+send rate.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import msgpack
+import websockets
+
+# Add the project root directory to Python path
+project_root = str(Path(__file__).parent.parent)
+sys.path.append(project_root)
+
+API_URL = "http://localhost:7001"
+EVENT_TYPES = ["motion_detected", "person_detected", "object_detected", "face_detected"]
+EVENT_WEIGHTS = [0.6, 0.2, 0.15, 0.05]
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def summarize(latencies):
+    """Latency percentiles in milliseconds"""
+    return {
+        "count": len(latencies),
+        "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50) * 1000, 2),
+        "p95": round(percentile(latencies, 95) * 1000, 2),
+        "p99": round(percentile(latencies, 99) * 1000, 2),
+        "max": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+def make_event(camera, rng):
+    return {
+        "device_id": camera,
+        "event_type": rng.choices(EVENT_TYPES, EVENT_WEIGHTS)[0],
+        "confidence": round(rng.uniform(0.3, 1.0), 2),
+        "raw_data": {
+            "timestamp": datetime.utcnow().isoformat(),
+            "location": f"zone_{int(camera.rsplit('_', 1)[1]) % 5 + 1}",
+            "image_url": f"https://example.com/images/{rng.randint(1000, 9999)}.jpg",
+            "metadata": {"resolution": "1920x1080", "fps": 30, "compression": "h264"},
+        },
+    }
+
+class Results:
+    """Everything the cameras and dashboards observed during a run"""
+
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.ingest_latencies = []
+        self.due_at = {}  # event id -> when its first occurrence was due
+        self.coalesced = 0
+        self.deliveries = []  # (event id, receive time)
+
+    def stored(self, event_id, due):
+        if event_id in self.due_at:
+            self.coalesced += 1
+        else:
+            self.due_at[event_id] = due
+
+async def camera_loop(name, rate, stop, send, rng):
+    """Emit events at `rate` per second, starting at a random phase"""
+    interval = 1 / rate
+    due = time.perf_counter() + rng.uniform(0, interval)
+    while not stop.is_set():
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await send(make_event(name, rng), due)
+        due += interval
+
+def http_sender(client, headers, results):
+    async def send(event, due):
+        results.sent += 1
+        try:
+            response = await client.post("/events/", json=event, headers=headers)
+        except httpx.HTTPError:
+            results.errors += 1
+            return
+        if response.status_code != 200:
+            results.errors += 1
+            return
+        results.ingest_latencies.append(time.perf_counter() - due)
+        results.stored(response.json()["id"], due)
+    return send
+
+class Gateway:
+    """One /ws/events socket shared by a group of cameras"""
+
+    def __init__(self, ws, results):
+        self.ws = ws
+        self.results = results
+        self.seq = 0
+        self.pending = {}  # seq -> due time
+
+    async def send(self, event, due):
+        self.results.sent += 1
+        self.seq += 1
+        self.pending[self.seq] = due
+        await self.ws.send(json.dumps(event))
+
+    async def read_acks(self):
+        async for message in self.ws:
+            ack = json.loads(message)
+            if ack.get("type") != "ack":
+                continue
+            now = time.perf_counter()
+            first = ack["seq"] - len(ack["ids"]) + 1
+            for seq, event_id in enumerate(ack["ids"], start=first):
+                due = self.pending.pop(seq, None)
+                if due is None:
+                    continue
+                if event_id is None:
+                    self.results.errors += 1
+                    continue
+                self.results.ingest_latencies.append(now - due)
+                self.results.stored(event_id, due)
+
+async def listen(ws_url, token, alert_format, ready, stop, results):
+    """Hold an alert socket open and record when each alert arrives"""
+    async with websockets.connect(f"{ws_url}/ws/alerts?token={token}&format={alert_format}") as ws:
+        ready.release()
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            now = time.perf_counter()
+            alert = msgpack.unpackb(message) if isinstance(message, bytes) else json.loads(message)
+            results.deliveries.append((alert["event_id"], now))
+
+async def run(args, api_url):
+    ws_url = api_url.replace("http", "ws", 1)
+    cameras = [f"camera_{i:05d}" for i in range(args.cameras)]
+    rng = random.Random(args.seed)
+    results = Results()
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=api_url, limits=limits, timeout=30) as client:
+        response = await client.post("/token", data={"username": args.email, "password": args.password})
+        response.raise_for_status()
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        stop_listeners = asyncio.Event()
+        ready = asyncio.Semaphore(0)
+        listeners = [
+            asyncio.create_task(listen(ws_url, token, args.alert_format, ready, stop_listeners, results))
+            for _ in range(args.websockets)
+        ]
+        for _ in range(args.websockets):
+            await ready.acquire()
+
+        gateways, ack_readers = [], []
+        if args.transport == "ws":
+            for _ in range(min(args.gateways, len(cameras))):
+                ws = await websockets.connect(f"{ws_url}/ws/events?token={token}")
+                gateways.append(Gateway(ws, results))
+            ack_readers = [asyncio.create_task(gateway.read_acks()) for gateway in gateways]
+            senders = [gateways[i % len(gateways)].send for i in range(len(cameras))]
+        else:
+            senders = [http_sender(client, headers, results)] * len(cameras)
+
+        stop = asyncio.Event()
+        camera_tasks = [
+            asyncio.create_task(camera_loop(name, args.rate, stop, send, random.Random(rng.random())))
+            for name, send in zip(cameras, senders)
+        ]
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*camera_tasks, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+        # Let outstanding acks and alerts arrive
+        await asyncio.sleep(args.drain)
+        for gateway in gateways:
+            await gateway.ws.close()
+        stop_listeners.set()
+        await asyncio.gather(*ack_readers, *listeners, return_exceptions=True)
+
+    delivery_latencies = [
+        received - results.due_at[event_id]
+        for event_id, received in results.deliveries
+        if event_id in results.due_at
+    ]
+    delivered = {event_id for event_id, _ in results.deliveries if event_id in results.due_at}
+    return {
+        "events_sent": results.sent,
+        "events_acknowledged": len(results.ingest_latencies),
+        "events_stored": len(results.due_at),
+        "events_coalesced": results.coalesced,
+        "errors": results.errors,
+        "ingest_throughput_eps": round(len(results.ingest_latencies) / elapsed, 1),
+        "ingest_latency_ms": summarize(results.ingest_latencies),
+        "alert_deliveries": len(results.deliveries),
+        "alerts_delivered_fraction": round(len(delivered) / len(results.due_at), 4) if results.due_at else 0.0,
+        "delivery_latency_ms": summarize(delivery_latencies),
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_local_stack(args):
+    """Run the app under uvicorn and a batch worker in background threads; returns the API URL"""
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/load_test.db"
+
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+    else:
+        import fakeredis
+        import fakeredis.aioredis
+        import redis
+        import redis.asyncio
+
+        # Every Redis client of the app, sync or async, shares one in-memory server
+        fake_server = fakeredis.FakeServer()
+        redis.Redis.from_url = classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=fake_server))
+        redis.asyncio.from_url = lambda url, **kwargs: fakeredis.aioredis.FakeRedis(server=fake_server)
+
+    import uvicorn
+    from app.auth import get_password_hash
+    from app.database import Base, SessionLocal, engine
+    from app.main import app
+    from app.models import User
+    from app.redis_client import redis_conn
+    from app.tasks import LANES
+    from app.worker import BatchWorker
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        if db.query(User).filter(User.email == args.email).first() is None:
+            db.add(User(email=args.email, hashed_password=get_password_hash(args.password)))
+            db.commit()
+    finally:
+        db.close()
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    worker = BatchWorker(list(LANES.values()), redis_conn, report_interval=3600)
+    threading.Thread(target=worker.work, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Metrics shown by --compare, and whether higher is better
+COMPARED_METRICS = [
+    ("ingest_throughput_eps", True),
+    ("ingest_latency_ms.p50", False),
+    ("ingest_latency_ms.p99", False),
+    ("delivery_latency_ms.p50", False),
+    ("delivery_latency_ms.p99", False),
+    ("alerts_delivered_fraction", True),
+    ("errors", False),
+]
+
+def compare(baseline, current):
+    print(f"{'metric':<28}{'baseline':>12}{'current':>12}{'change':>10}")
+    for metric, higher_is_better in COMPARED_METRICS:
+        old, new = baseline["results"], current["results"]
+        for part in metric.split("."):
+            old, new = old[part], new[part]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        worse = (new < old) if higher_is_better else (new > old)
+        print(f"{metric:<28}{old:>12}{new:>12}{change:>10}{'  worse' if worse and old != new else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest and alert delivery benchmark")
+    parser.add_argument("--api-url", default=API_URL)
+    parser.add_argument("--email", default="test@example.com")
+    parser.add_argument("--password", default="testpassword")
+    parser.add_argument("--cameras", type=int, default=100, help="simulated cameras")
+    parser.add_argument("--rate", type=float, default=1.0, help="events per second per camera")
+    parser.add_argument("--transport", choices=["http", "ws"], default="http",
+                        help="POST /events/ per event, or stream through /ws/events gateways")
+    parser.add_argument("--gateways", type=int, default=10, help="/ws/events sockets for --transport ws")
+    parser.add_argument("--connections", type=int, default=100, help="HTTP connection pool size")
+    parser.add_argument("--websockets", type=int, default=10, help="listening /ws/alerts dashboards")
+    parser.add_argument("--alert-format", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of load")
+    parser.add_argument("--drain", type=float, default=5, help="seconds to wait for alerts after the load stops")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true", help="run the app and a worker in-process")
+    parser.add_argument("--database-url", help="with --local: database to use instead of a temporary SQLite file")
+    parser.add_argument("--redis-url", help="with --local: Redis to use instead of fakeredis")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    api_url = start_local_stack(args) if args.local else args.api_url
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.utcnow().isoformat(),
+            "local": args.local,
+            "args": {key: value for key, value in vars(args).items() if key not in ("password", "output", "compare")},
+        },
+        "results": asyncio.run(run(args, api_url)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ sys.path.append(project_root)
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from alembic import command
+from alembic.config import Config
 from app.database import Base
 from app.models import User, Event, Alert
 from app.auth import get_password_hash
@@ -41,6 +43,16 @@ def init_db():
         print(f"Error creating database tables: {e}")
         return False
 
+def run_migrations():
+    """Apply Alembic migrations (indexes and schema changes for existing tables)"""
+    try:
+        command.upgrade(Config(os.path.join(project_root, "alembic.ini")), "head")
+        print("Database migrations applied successfully")
+        return True
+    except Exception as e:
+        print(f"Error applying database migrations: {e}")
+        return False
+
 def create_test_user():
     """Create test user if it doesn't exist"""
     db = None
@@ -86,6 +98,11 @@ def main():
     if not init_db():
         print("Failed to initialize database.")
         return False
+
+    # Apply migrations
+    if not run_migrations():
+        print("Failed to apply database migrations.")
+        return False
     
     # Create test user
     if not create_test_user():
@@ -0,0 +1,13 @@
+import os
+import sys
+
+import fakeredis
+import pytest
+
+# Add the project root to the Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def redis():
+    """An in-memory Redis that runs Lua scripts (needs lupa)"""
+    return fakeredis.FakeRedis()
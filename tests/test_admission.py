@@ -0,0 +1,110 @@
+import asyncio
+
+import fakeredis.aioredis
+
+from app import admission
+from app.admission import ADMIT_SCRIPT, AdmissionController, admit_events
+from app.tasks import LANES
+
+NOW = 1_000_000
+
+def run_admit(redis, now, buckets, queues=()):
+    """Call ADMIT_SCRIPT with (key, rate, burst, cost) buckets and (key, max depth) queues"""
+    keys = [key for key, _ in queues] + [key for key, *_ in buckets]
+    args = [now, len(queues)] + [depth for _, depth in queues]
+    for _, rate, burst, cost in buckets:
+        args += [rate, burst, cost]
+    return redis.register_script(ADMIT_SCRIPT)(keys=keys, args=args)
+
+def tokens(redis, key):
+    return float(redis.hget(key, "tokens"))
+
+def test_admits_and_takes_tokens(redis):
+    assert run_admit(redis, NOW, [("user", 10, 10, 3)]) is None
+    assert tokens(redis, "user") == 7
+    assert 0 < redis.pttl("user") <= 2000
+
+def test_rejects_with_wait_until_refilled(redis):
+    assert run_admit(redis, NOW, [("device", 10, 5, 5)]) is None
+    # 100 ms refill one token at 10/s; three are needed
+    assert run_admit(redis, NOW + 100, [("device", 10, 5, 4)]) == [1, 300]
+    assert run_admit(redis, NOW + 400, [("device", 10, 5, 4)]) is None
+    assert tokens(redis, "device") == 0
+
+def test_refill_is_capped_at_burst(redis):
+    assert run_admit(redis, NOW, [("device", 10, 5, 5)]) is None
+    assert run_admit(redis, NOW + 60_000, [("device", 10, 5, 1)]) is None
+    assert tokens(redis, "device") == 4
+
+def test_request_larger_than_burst_leaves_debt(redis):
+    assert run_admit(redis, NOW, [("device", 10, 5, 8)]) is None
+    assert tokens(redis, "device") == -3
+    # Back to the full burst of 5 takes 800 ms
+    assert run_admit(redis, NOW + 100, [("device", 10, 5, 8)]) == [1, 700]
+    assert run_admit(redis, NOW + 800, [("device", 10, 5, 8)]) is None
+
+def test_tokens_are_taken_all_or_nothing(redis):
+    assert run_admit(redis, NOW, [("device:b", 10, 5, 5)]) is None
+    result = run_admit(redis, NOW, [("user", 100, 100, 2), ("device:a", 10, 5, 1), ("device:b", 10, 5, 1)])
+    assert result == [3, 100]
+    assert not redis.exists("user")
+    assert not redis.exists("device:a")
+    assert tokens(redis, "device:b") == 0
+
+def test_reports_the_longest_wait(redis):
+    assert run_admit(redis, NOW, [("user", 10, 5, 5), ("device", 1, 5, 5)]) is None
+    assert run_admit(redis, NOW, [("user", 10, 5, 1), ("device", 1, 5, 1)]) == [2, 1000]
+
+def test_sheds_when_any_queue_is_too_long(redis):
+    redis.rpush("bulk", *range(3))
+    queues = [("critical", 3), ("default", 3), ("bulk", 3)]
+    assert run_admit(redis, NOW, [("user", 10, 5, 1)], queues) == [0, 3]
+    assert not redis.exists("user")
+    assert run_admit(redis, NOW, [("user", 10, 5, 1)], [("critical", 3), ("default", 3), ("bulk", 4)]) is None
+
+def test_controller_checks_the_bulk_lane(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setitem(admission.ADMISSION_MAX_QUEUE_DEPTHS, "bulk", 2)
+    controller = AdmissionController(redis)
+
+    async def check():
+        await redis.rpush(LANES["bulk"].key, "a", "b")
+        rejection = await controller.check(1, ["cam-1"])
+        await redis.lpop(LANES["bulk"].key)
+        return rejection, await controller.check(1, ["cam-1"])
+
+    shed, admitted = asyncio.run(check())
+    assert shed.reason == "queue"
+    assert admitted is None
+
+def test_bulk_backlog_does_not_shed_critical_events(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setitem(admission.ADMISSION_MAX_QUEUE_DEPTHS, "bulk", 2)
+    controller = AdmissionController(redis)
+
+    async def check():
+        await redis.rpush(LANES["bulk"].key, "a", "b")
+        return (await controller.check(1, ["cam-1"], ["critical"]),
+                await controller.check(1, ["cam-1", "cam-2"], ["critical", "bulk"]))
+
+    critical, mixed = asyncio.run(check())
+    assert critical is None
+    assert mixed.reason == "queue"
+    assert mixed.lane == "bulk"
+
+def test_streamed_batch_sheds_only_events_for_the_saturated_lane(monkeypatch):
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setitem(admission.ADMISSION_MAX_QUEUE_DEPTHS, "bulk", 2)
+    monkeypatch.setattr(admission, "admission", AdmissionController(redis))
+
+    async def check():
+        await redis.rpush(LANES["bulk"].key, "a", "b")
+        rejections = await admit_events(1, ["cam-1", "cam-2", "cam-3"], ["bulk", "critical", "default"])
+        return rejections, float(await redis.hget(admission.user_bucket_key(1), "tokens"))
+
+    (bulk, critical, default), user_tokens = asyncio.run(check())
+    assert bulk.reason == "queue"
+    assert critical is None
+    assert default is None
+    # Only the admitted events took tokens
+    assert user_tokens == admission.RATE_LIMIT_USER_BURST - 2
@@ -0,0 +1,79 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import fakeredis.aioredis
+
+from app import alert_cache
+from app.alert_cache import COMPLETE, cache_alerts, cache_key, fill_alert_cache, read_cached_alerts
+
+START = datetime(2026, 10, 18, 10)
+
+def make_alert(alert_id, seconds=None, severity="normal"):
+    created_at = START + timedelta(seconds=alert_id if seconds is None else seconds)
+    return {"id": alert_id, "event_id": alert_id * 10, "user_id": 1, "severity": severity,
+            "description": f"alert {alert_id}", "created_at": created_at}
+
+def ids(page):
+    return None if page is None else [json.loads(member)["id"] for member in page]
+
+async def write_through(redis, alerts):
+    pipe = redis.pipeline(transaction=False)
+    cache_alerts(pipe, alerts)
+    await pipe.execute()
+
+def test_short_page_of_a_complete_set_is_a_hit():
+    redis = fakeredis.aioredis.FakeRedis()
+
+    async def scenario():
+        # Newest first, as the database returns them
+        await fill_alert_cache(redis, 1, None, [make_alert(i) for i in (3, 2, 1)])
+        return (await read_cached_alerts(redis, 1, None, 0, 10),
+                await read_cached_alerts(redis, 1, None, 2, 10))
+
+    first, tail = asyncio.run(scenario())
+    assert ids(first) == [3, 2, 1]
+    assert ids(tail) == [1]
+
+def test_write_through_set_misses_pages_it_cannot_fill():
+    redis = fakeredis.aioredis.FakeRedis()
+
+    async def scenario():
+        await write_through(redis, [make_alert(1), make_alert(2)])
+        return (await read_cached_alerts(redis, 1, None, 0, 2),
+                await read_cached_alerts(redis, 1, None, 0, 3),
+                await read_cached_alerts(redis, 1, "normal", 0, 2))
+
+    full, short, by_severity = asyncio.run(scenario())
+    assert ids(full) == [2, 1]
+    # Older alerts may exist that the set never saw
+    assert short is None
+    assert ids(by_severity) == [2, 1]
+
+def test_alerts_with_the_same_timestamp_are_ordered_by_id():
+    redis = fakeredis.aioredis.FakeRedis()
+
+    async def scenario():
+        await write_through(redis, [make_alert(9, seconds=0), make_alert(10, seconds=0), make_alert(11, seconds=-1)])
+        return await read_cached_alerts(redis, 1, None, 0, 3)
+
+    assert ids(asyncio.run(scenario())) == [10, 9, 11]
+
+def test_complete_marker_is_trimmed_once_the_set_outgrows_the_cache(monkeypatch):
+    monkeypatch.setattr(alert_cache, "ALERT_CACHE_SIZE", 3)
+    redis = fakeredis.aioredis.FakeRedis()
+
+    async def scenario():
+        await fill_alert_cache(redis, 1, None, [make_alert(2), make_alert(1)])
+        short_before = await read_cached_alerts(redis, 1, None, 0, 3)
+        await write_through(redis, [make_alert(3)])
+        members = await redis.zrange(cache_key(1), 0, -1)
+        return short_before, members, await read_cached_alerts(redis, 1, None, 1, 3)
+
+    short_before, members, short_after = asyncio.run(scenario())
+    # Two alerts and the marker fill the cache
+    assert ids(short_before) == [2, 1]
+    # A third alert pushes the marker out, as the lowest scored member
+    assert COMPLETE not in members
+    assert len(members) == 3
+    assert ids(short_after) is None
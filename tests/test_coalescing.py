@@ -0,0 +1,84 @@
+import asyncio
+from datetime import datetime
+
+import fakeredis.aioredis
+
+from app.coalescing import (
+    CLAIM_SCRIPT, PENDING_CONFIDENCE_KEY, PENDING_COUNT_KEY, PENDING_TIMESTAMP_KEY, EventCoalescer,
+)
+from app.schemas import EventCreate
+from app.tasks import classify_events
+
+WINDOW_MS = 2000
+MAX_SPAN_MS = 10_000
+TTL_MS = 5000
+KEY = "dedup:window:1:cam-1:motion:"
+TIMESTAMP = b"2026-10-18T10:00:00"
+
+def claim(redis, now, confidence, count=1):
+    return redis.register_script(CLAIM_SCRIPT)(
+        keys=[KEY, PENDING_COUNT_KEY, PENDING_CONFIDENCE_KEY, PENDING_TIMESTAMP_KEY],
+        args=[now, WINDOW_MS, MAX_SPAN_MS, confidence, TTL_MS, count],
+    )
+
+def register(redis, event_id):
+    redis.hset(KEY, mapping={"event_id": event_id, "timestamp": TIMESTAMP})
+
+def test_first_event_opens_a_burst(redis):
+    assert claim(redis, 1000, 0.5) is None
+    assert redis.hget(KEY, "event_id") == b""
+    assert 0 < redis.pttl(KEY) <= TTL_MS
+
+def test_duplicates_pass_until_the_leader_is_registered(redis):
+    assert claim(redis, 1000, 0.5) is None
+    assert claim(redis, 1100, 0.5) is None
+    assert not redis.exists(PENDING_COUNT_KEY)
+
+def test_duplicate_is_merged_into_the_leader(redis):
+    claim(redis, 1000, 0.5)
+    register(redis, 7)
+    assert claim(redis, 1500, 0.9) == [b"7", b"2", b"0.9", TIMESTAMP]
+    assert claim(redis, 2000, 0.6) == [b"7", b"3", b"0.9", TIMESTAMP]
+    assert redis.hget(PENDING_COUNT_KEY, "7") == b"2"
+    assert float(redis.hget(PENDING_CONFIDENCE_KEY, "7")) == 0.9
+    assert redis.hget(PENDING_TIMESTAMP_KEY, "7") == TIMESTAMP
+
+def test_window_slides_with_every_duplicate(redis):
+    claim(redis, 0, 0.5)
+    register(redis, 7)
+    for now in range(1500, 9001, 1500):
+        assert claim(redis, now, 0.5)[0] == b"7"
+    # More than WINDOW_MS after the last duplicate
+    assert claim(redis, 9000 + WINDOW_MS + 1, 0.5) is None
+    assert redis.hget(KEY, "event_id") == b""
+
+def test_burst_ends_after_max_span(redis):
+    claim(redis, 0, 0.5)
+    register(redis, 7)
+    for now in range(1000, MAX_SPAN_MS + 1, 1000):
+        assert claim(redis, now, 0.5)[0] == b"7"
+    assert claim(redis, MAX_SPAN_MS + 1000, 0.5) is None
+
+def test_escalating_detection_opens_its_own_burst():
+    # config/alert_rules.json rates person_detected at 0.9 or more critical
+    coalescer = EventCoalescer(fakeredis.aioredis.FakeRedis())
+
+    async def ingest(confidence):
+        event = EventCreate(device_id="cam-1", event_type="person_detected", confidence=confidence,
+                            raw_data={"location": "zone_2"})
+        classes = [f"{severity}:{lane}" for severity, lane in classify_events([event])]
+        return (await coalescer.claim(1, [event], classes))[0]
+
+    async def scenario():
+        leader = await ingest(0.5)
+        await coalescer.register([(leader, 7, datetime(2026, 10, 18, 10))])
+        duplicate = await ingest(0.6)
+        escalated = await ingest(0.95)
+        await coalescer.register([(escalated, 8, datetime(2026, 10, 18, 10))])
+        return leader, duplicate, escalated, await ingest(0.97)
+
+    leader, duplicate, escalated, critical_duplicate = asyncio.run(scenario())
+    assert not leader.is_duplicate
+    assert duplicate.event_id == 7
+    assert not escalated.is_duplicate
+    assert critical_duplicate.event_id == 8
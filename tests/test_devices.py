@@ -0,0 +1,19 @@
+from app.devices import CLAIM_OFFLINE_SCRIPT, DEADLINES_KEY
+
+def claim_offline(redis, now, limit=100):
+    return redis.register_script(CLAIM_OFFLINE_SCRIPT)(keys=[DEADLINES_KEY], args=[now, limit])
+
+def test_claims_only_passed_deadlines(redis):
+    redis.zadd(DEADLINES_KEY, {"1:cam-a": 100, "1:cam-b": 200, "2:cam-a": 300})
+    assert claim_offline(redis, 200) == [b"1:cam-a", b"100", b"1:cam-b", b"200"]
+    assert redis.zrange(DEADLINES_KEY, 0, -1) == [b"2:cam-a"]
+
+def test_each_deadline_is_claimed_once(redis):
+    redis.zadd(DEADLINES_KEY, {"1:cam-a": 100})
+    assert claim_offline(redis, 150) == [b"1:cam-a", b"100"]
+    assert claim_offline(redis, 150) == []
+
+def test_claims_at_most_the_limit_oldest_first(redis):
+    redis.zadd(DEADLINES_KEY, {f"1:cam-{i}": i for i in range(5)})
+    assert claim_offline(redis, 10, limit=2)[::2] == [b"1:cam-0", b"1:cam-1"]
+    assert redis.zcard(DEADLINES_KEY) == 3
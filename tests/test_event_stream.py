@@ -0,0 +1,26 @@
+import json
+
+import msgpack
+import pytest
+
+from app.event_stream import FrameError, decode_frame, parse_event
+from app.schemas import CurrentUser, EventCreate
+
+USER = CurrentUser(id=1, email="a@example.com")
+EVENT = {"device_id": "cam-1", "event_type": "motion_detected", "confidence": 0.5, "raw_data": {}}
+
+def test_bad_json_line_keeps_the_rest_of_the_frame():
+    text = "\n".join([json.dumps(EVENT), "{not json", "", json.dumps([{"device_id": "cam-2"}, EVENT])])
+    objects, binary = decode_frame({"text": text})
+    assert not binary
+    parsed = [parse_event(USER, obj) for obj in objects]
+    assert len(parsed) == 4
+    assert isinstance(parsed[0], EventCreate)
+    assert parsed[1].startswith("Invalid JSON line")
+    assert parsed[2].startswith("Invalid event")
+    assert isinstance(parsed[3], EventCreate)
+
+def test_undecodable_binary_frame_is_rejected_whole():
+    assert decode_frame({"bytes": msgpack.packb([EVENT, EVENT])}) == ([EVENT, EVENT], True)
+    with pytest.raises(FrameError):
+        decode_frame({"bytes": b"\xc1"})
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import fakeredis
+import fakeredis.aioredis
+import msgpack
+
+from app import pubsub, websocket_manager
+from app.pubsub import ALERTS_CHANNEL, listen_for_alerts, publish_alerts
+from app.websocket_manager import ConnectionManager, broadcast_alert
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+async def wait_for(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_published_alert_reaches_only_its_users_sockets(monkeypatch):
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeRedis(server=server)
+    monkeypatch.setattr(pubsub.aioredis, "from_url", lambda url: fakeredis.aioredis.FakeRedis(server=server))
+    manager = ConnectionManager()
+    monkeypatch.setattr(websocket_manager, "manager", manager)
+    alert = {"id": 1, "event_id": 10, "severity": "critical", "description": "motion",
+             "created_at": "2026-10-18T10:00:00", "user_id": 1}
+
+    async def scenario():
+        listener = asyncio.create_task(listen_for_alerts("redis://unused"))
+        await wait_for(lambda: redis.pubsub_numsub(ALERTS_CHANNEL)[0][1] == 1)
+        owner, other_user = FakeWebSocket(), FakeWebSocket()
+        closed = FakeWebSocket()
+        manager.connect(owner, 1)
+        manager.connect(other_user, 2)
+        manager.disconnect(manager.connect(closed, 1))
+
+        # A malformed message on the channel does not cost the subscription
+        redis.publish(ALERTS_CHANNEL, "{not json")
+        publish_alerts(redis, [alert])
+        await wait_for(lambda: owner.sent)
+        # Give the other sockets' writers a chance to run
+        await asyncio.sleep(0.05)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        for connections in list(manager.connections.values()):
+            for connection in list(connections):
+                manager.disconnect(connection)
+        return owner, other_user, closed
+
+    owner, other_user, closed = asyncio.run(scenario())
+    assert [json.loads(message) for message in owner.sent] == [alert]
+    assert other_user.sent == []
+    assert closed.sent == []
+    assert redis.zcard(pubsub.replay_key(1)) == 1
+
+def test_msgpack_clients_share_one_decode_per_alert(monkeypatch):
+    manager = ConnectionManager()
+    monkeypatch.setattr(websocket_manager, "manager", manager)
+    decoded = []
+    loads = json.loads
+    monkeypatch.setattr(websocket_manager.json, "loads", lambda text: decoded.append(text) or loads(text))
+    alerts = [{"id": i, "severity": "low", "description": "motion", "user_id": 1} for i in (1, 2)]
+
+    async def scenario():
+        sockets = [FakeWebSocket() for _ in range(3)]
+        for websocket in sockets:
+            manager.connect(websocket, 1, format="msgpack", batch_ms=50)
+        for alert in alerts:
+            await broadcast_alert(json.dumps(alert))
+        await wait_for(lambda: all(websocket.sent for websocket in sockets))
+        for connection in list(manager.connections[1]):
+            manager.disconnect(connection)
+        return sockets
+
+    sockets = asyncio.run(scenario())
+    assert [msgpack.unpackb(websocket.sent[0]) for websocket in sockets] == [alerts] * 3
+    assert len(decoded) == len(alerts)
@@ -0,0 +1,91 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app import scoring
+from app.scoring import UNKNOWN, RuleEngine, get_rule_engine
+
+RULES = {
+    "severities": ["low", "normal", "critical"],
+    "default_severity": "low",
+    "rules": [
+        {"event_type": "person_detected", "min_confidence": 0.5, "severity": "normal"},
+        {"event_type": "person_detected", "min_confidence": 0.9, "severity": "critical"},
+        {"event_type": "person_detected", "location": "zone_1", "min_confidence": 0.6, "severity": "critical"},
+        {"device_id": "cam-door", "min_confidence": 0.8, "severity": "normal"},
+    ],
+}
+
+def score(engine, *events):
+    """Score (event_type, device_id, location, confidence) tuples"""
+    return engine.score(*(list(column) for column in zip(*events)))
+
+def test_highest_matching_rule_wins():
+    engine = RuleEngine(RULES)
+    assert score(engine,
+                 ("person_detected", "cam-1", "zone_2", 0.4),
+                 ("person_detected", "cam-1", "zone_2", 0.5),
+                 ("person_detected", "cam-1", "zone_2", 0.95)) == ["low", "normal", "critical"]
+
+def test_location_rule_applies_only_to_its_location():
+    engine = RuleEngine(RULES)
+    assert score(engine,
+                 ("person_detected", "cam-1", "zone_1", 0.7),
+                 ("person_detected", "cam-1", "zone_2", 0.7),
+                 ("person_detected", "cam-1", None, 0.7)) == ["critical", "normal", "normal"]
+
+def test_omitted_fields_match_every_event():
+    engine = RuleEngine(RULES)
+    # The cam-door rule names no event_type or location
+    assert score(engine,
+                 ("motion_detected", "cam-door", "zone_9", 0.85),
+                 ("motion_detected", "cam-door", None, 0.7),
+                 ("motion_detected", "cam-2", "zone_9", 0.85)) == ["normal", "low", "low"]
+
+def test_values_no_rule_mentions_get_the_unknown_code():
+    engine = RuleEngine(RULES)
+    codes = engine.encode("event_type", ["person_detected", "smoke_detected", None])
+    assert codes[0] >= 0
+    assert codes[1] == codes[2] == UNKNOWN
+    assert score(engine, ("smoke_detected", "cam-1", "zone_1", 1.0)) == ["low"]
+
+def test_no_rules_scores_everything_default():
+    engine = RuleEngine({"severities": ["normal", "critical"]})
+    assert score(engine, ("person_detected", "cam-1", "zone_1", 1.0)) == ["normal"]
+
+def test_large_batches_are_scored_in_chunks(monkeypatch):
+    monkeypatch.setattr(scoring, "CHUNK_SIZE", 4)
+    engine = RuleEngine(RULES)
+    confidences = np.linspace(0.0, 1.0, 11)
+    severities = engine.score(["person_detected"] * 11, ["cam-1"] * 11, ["zone_2"] * 11, confidences)
+    expected = ["critical" if c >= 0.9 else "normal" if c >= 0.5 else "low" for c in confidences]
+    assert severities == expected
+
+@pytest.fixture
+def rules_file(tmp_path, monkeypatch):
+    path = tmp_path / "alert_rules.json"
+    path.write_text(json.dumps(RULES))
+    monkeypatch.setattr(scoring, "RULES_PATH", str(path))
+    monkeypatch.setattr(scoring, "RELOAD_CHECK_SECONDS", 0)
+    monkeypatch.setattr(scoring, "_engine", None)
+    monkeypatch.setattr(scoring, "_engine_mtime", None)
+    return path
+
+def test_changed_rules_file_is_reloaded(rules_file):
+    assert get_rule_engine().severities == ["low", "normal", "critical"]
+    rules_file.write_text(json.dumps({"severities": ["normal", "critical"], "rules": []}))
+    os.utime(rules_file, (0, 1))
+    assert get_rule_engine().severities == ["normal", "critical"]
+
+def test_unparsable_rules_file_keeps_the_previous_rules(rules_file):
+    engine = get_rule_engine()
+    rules_file.write_text("{not json")
+    os.utime(rules_file, (0, 1))
+    assert get_rule_engine() is engine
+
+def test_unparsable_rules_file_fails_without_previous_rules(rules_file):
+    rules_file.write_text("{not json")
+    with pytest.raises(ValueError):
+        get_rule_engine()
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from rq import Queue
+from rq.job import Job
+
+from app import tasks, worker
+from app.worker import JOB_LEASE_SECONDS, BatchWorker
+
+@pytest.fixture
+def queues(redis):
+    return [Queue(name, connection=redis) for name in ("test_critical", "test_default", "test_bulk")]
+
+def enqueue(queue, *event_ids):
+    return [queue.enqueue(worker.PROCESS_EVENT_FUNC, event_id).id for event_id in event_ids]
+
+def registered(queue):
+    return set(queue.started_job_registry.get_job_ids())
+
+def test_claim_takes_the_most_urgent_lane_first(redis, queues):
+    critical, default, _ = queues
+    enqueue(default, 1, 2)
+    critical_ids = enqueue(critical, 3, 4)
+    batch_worker = BatchWorker(queues, redis)
+
+    before = time.time()
+    queue, job_ids = batch_worker.claim(queues, 10)
+    assert queue is critical
+    assert job_ids == critical_ids
+    assert critical.count == 0
+    assert default.count == 2
+    # Claimed jobs are registered as started, due when their lease ends
+    assert registered(critical) == set(critical_ids)
+    for job_id in critical_ids:
+        lease_end = redis.zscore(critical.started_job_registry.key, job_id)
+        assert before + JOB_LEASE_SECONDS <= lease_end <= time.time() + JOB_LEASE_SECONDS
+
+def test_claim_returns_partial_batches(redis, queues):
+    critical, default, _ = queues
+    critical_ids = enqueue(critical, 1, 2)
+    default_ids = enqueue(default, 3, 4, 5)
+    batch_worker = BatchWorker(queues, redis)
+
+    assert batch_worker.claim(queues, 5) == (critical, critical_ids)
+    assert batch_worker.claim(queues, 2) == (default, default_ids[:2])
+    assert batch_worker.claim(queues, 2) == (default, default_ids[2:])
+    assert batch_worker.claim(queues, 2) == (None, [])
+
+def test_fetch_batch_stops_at_max_wait(redis, queues):
+    critical = queues[0]
+    critical_ids = enqueue(critical, 1, 2)
+    batch_worker = BatchWorker(queues, redis, batch_size=10, max_wait_ms=0)
+
+    queue, jobs = batch_worker.fetch_batch()
+    assert queue is critical
+    assert [job.id for job in jobs] == critical_ids
+
+def test_expired_leases_go_back_on_their_queue(redis, queues, monkeypatch):
+    critical, default, _ = queues
+    critical_ids = enqueue(critical, 1)
+    default_ids = enqueue(default, 2)
+    batch_worker = BatchWorker(queues, redis)
+    batch_worker.claim(queues, 10)
+    batch_worker.claim(queues, 10)
+
+    assert batch_worker.requeue_expired() == 0
+    assert critical.count == 0 and default.count == 0
+
+    now = time.time()
+    monkeypatch.setattr(worker.time, "time", lambda: now + JOB_LEASE_SECONDS + 1)
+    assert batch_worker.requeue_expired() == 2
+    assert critical.job_ids == critical_ids
+    assert default.job_ids == default_ids
+    assert registered(critical) == registered(default) == set()
+
+def test_failed_batch_runs_jobs_one_by_one(redis, queues, monkeypatch):
+    critical = queues[0]
+    job_ids = enqueue(critical, 1, 2, 3)
+    processed = []
+
+    def process_events(event_ids):
+        raise RuntimeError("batch failed")
+
+    def process_event(event_id):
+        if event_id == 2:
+            raise ValueError("bad event")
+        processed.append(event_id)
+
+    monkeypatch.setattr(worker, "process_events", process_events)
+    monkeypatch.setattr(tasks, "process_event", process_event)
+    batch_worker = BatchWorker(queues, redis)
+    queue, jobs = batch_worker.fetch_batch()
+
+    assert batch_worker.process_batch(queue, jobs) == 1
+    assert processed == [1, 3]
+    assert registered(critical) == set()
+    assert critical.failed_job_registry.get_job_ids() == [job_ids[1]]
+    # Finished jobs are deleted; the failed one is kept for inspection
+    assert Job.fetch_many(job_ids, connection=redis)[0] is None
+    assert Job.fetch_many(job_ids, connection=redis)[1] is not None